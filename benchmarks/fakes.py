@@ -0,0 +1,136 @@
+# benchmarks/fakes.py
+import re
+import json
+import time
+import random
+import asyncio
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+# Deterministic stand-ins for Gemini and Tavily. Latency is drawn from a seeded
+# RNG, so two runs with the same settings issue the same delays and failures.
+# Install them with install_fakes() before the app handles requests.
+
+# the per-part suffix starts "PART 3 — ..." or "PARTS 3, 4 — ..." (see chains.build_part_suffix)
+_REQUESTED_PARTS_RE = re.compile(r"\bPARTS? ([\d, ]+?) —")
+
+class FakeProviderError(Exception):
+    """Injected failure; carries a status code so resilience.py treats it like a provider 503."""
+
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message)
+        self.status_code = status_code
+
+class FakeChatModel:
+    """
+    Chat model with ainvoke/astream like LangChain's, producing output in the
+    directive marker format for whichever parts the prompt asks for.
+
+    latency: seconds before the first chunk (plus uniform +-jitter)
+    chunk_delay: seconds between chunks; chunk_chars: characters per chunk
+    error_rate: probability that a call fails before its first chunk
+    deliverable_chars: length of each part's deliverable text
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, chunk_delay: float = 0.01,
+                 chunk_chars: int = 24, error_rate: float = 0.0, deliverable_chars: int = 1200,
+                 seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_delay = chunk_delay
+        self.chunk_chars = max(1, chunk_chars)
+        self.error_rate = error_rate
+        self.deliverable_chars = deliverable_chars
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def _maybe_fail(self):
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise FakeProviderError("fake provider unavailable (503)")
+
+    def _output(self, prompt: str) -> str:
+        matches = _REQUESTED_PARTS_RE.findall(prompt)
+        parts = [int(p) for p in re.findall(r"\d+", matches[-1])] if matches else None
+        if not parts:
+            # chat turn
+            return "Fake counsel answer. " * max(1, self.deliverable_chars // 200)
+        sections = []
+        for part in parts:
+            body = (f"Part {part} analysis of the facts. " * (self.deliverable_chars // 30 + 1))[:self.deliverable_chars]
+            queries = [f"part {part} consumer protection precedent", f"part {part} limitation period"]
+            text = (
+                f"----THOUGHTS----\nReasoning for part {part}.\n"
+                f"----SEARCH_QUERIES----\n{json.dumps(queries)}\n"
+                f"----DELIVERABLE----\n{body}\n"
+            )
+            sections.append(f"====PART {part}====\n{text}" if len(parts) > 1 else text)
+        return "".join(sections)
+
+    @staticmethod
+    def _prompt_text(prompt: Any) -> str:
+        if isinstance(prompt, list):
+            return "\n".join(str(getattr(m, "content", m)) for m in prompt)
+        return str(prompt)
+
+    async def ainvoke(self, prompt: Any, **kwargs) -> str:
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        return self._output(self._prompt_text(prompt))
+
+    async def astream(self, prompt: Any, **kwargs) -> AsyncGenerator[str, None]:
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        text = self._output(self._prompt_text(prompt))
+        for i in range(0, len(text), self.chunk_chars):
+            if i and self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield text[i:i + self.chunk_chars]
+
+def fake_model_factory(**options) -> Callable[[str, float, Optional[int]], FakeChatModel]:
+    """Model factory for model_registry.init_registry(factory=...); one FakeChatModel per model key."""
+    def factory(model: str, temperature: float, max_tokens: Optional[int]) -> FakeChatModel:
+        return FakeChatModel(**options)
+    return factory
+
+class FakeTavily:
+    """Synchronous .invoke(query) like TavilySearch, returning a Tavily-shaped response."""
+
+    def __init__(self, latency: float = 0.3, jitter: float = 0.1, error_rate: float = 0.0,
+                 results: int = 5, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.results = results
+        self.rng = random.Random(seed)
+        self.calls = 0
+
+    def invoke(self, query: str) -> Dict[str, Any]:
+        # called from a worker thread by execute_tools, like the real client
+        self.calls += 1
+        time.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            raise FakeProviderError("fake search unavailable (503)")
+        items: List[Dict[str, Any]] = [
+            {"title": f"{query} — result {i}", "url": f"https://example.org/{i}", "content": f"Snippet {i} for {query}. " * 8}
+            for i in range(self.results)
+        ]
+        return {"query": query, "answer": f"Summary for {query}.", "results": items}
+
+def install_fakes(llm: Optional[Dict[str, Any]] = None, search: Optional[Dict[str, Any]] = None) -> FakeTavily:
+    """
+    Routes the directive/chat models and Tavily to the fakes. Must run before
+    the first request (the app's lifespan would otherwise build real clients).
+    """
+    import execute_tools
+    from model_registry import init_registry
+
+    init_registry(factory=fake_model_factory(**(llm or {})))
+    fake_search = FakeTavily(**(search or {}))
+    execute_tools.set_tavily(fake_search)
+    # cached results would hide search latency between runs
+    execute_tools.SEARCH_CACHE.clear()
+    return fake_search
@@ -0,0 +1,198 @@
+# benchmarks/load_test.py
+"""
+Offline load test: runs the API in-process on a loopback port with fake LLM
+and search backends, then drives /generate_directive (and optionally /chat)
+with N concurrent clients and reports throughput, TTFB and completion-time
+percentiles.
+
+    python -m benchmarks.load_test --clients 20 --requests 3 --llm-latency 0.8 --chat-turns 2
+
+Run from the repository root. No API keys or network access are needed.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import install_fakes
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile, or None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100.0 * len(ordered) + 0.4999)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def summarize(name: str, samples: List[Dict[str, Any]], wall: float) -> Dict[str, Any]:
+    ok = [s for s in samples if s["ok"]]
+    summary = {"name": name, "requests": len(samples), "ok": len(ok), "errors": len(samples) - len(ok),
+               "throughput_rps": round(len(ok) / wall, 3) if wall else 0.0}
+    for metric in ("ttfb", "first_part", "total"):
+        values = [s[metric] for s in ok if s.get(metric) is not None]
+        for pct in (50, 95, 99):
+            value = percentile(values, pct)
+            summary[f"{metric}_p{pct}"] = round(value, 4) if value is not None else None
+    summary["bytes"] = sum(s.get("bytes", 0) for s in samples)
+    return summary
+
+async def stream_request(client: httpx.AsyncClient, path: str, body: Dict[str, Any],
+                         first_part_marker: Optional[str] = None) -> Dict[str, Any]:
+    """POSTs `body` and reads the streamed response, timing first byte, first part and completion."""
+    sample = {"ok": False, "ttfb": None, "first_part": None, "total": None, "bytes": 0, "text": ""}
+    start = time.perf_counter()
+    pieces = []
+    try:
+        async with client.stream("POST", path, json=body) as response:
+            async for chunk in response.aiter_text():
+                now = time.perf_counter() - start
+                if sample["ttfb"] is None:
+                    sample["ttfb"] = now
+                pieces.append(chunk)
+                sample["bytes"] += len(chunk.encode())
+                if first_part_marker and sample["first_part"] is None and first_part_marker in chunk:
+                    sample["first_part"] = now
+            sample["ok"] = response.status_code == 200
+            sample["status"] = response.status_code
+    except Exception as e:
+        sample["error"] = str(e)
+    sample["total"] = time.perf_counter() - start
+    sample["text"] = "".join(pieces)
+    return sample
+
+def conversation_id_from(text: str) -> Optional[str]:
+    for line in text.splitlines():
+        line = line[len("data: "):] if line.startswith("data: ") else line
+        if line.startswith("[CONVERSATION_ID] "):
+            return line.split(" ", 1)[1].strip()
+        if line.startswith("{") and '"conversation"' in line:
+            try:
+                return json.loads(line).get("conversation_id")
+            except ValueError:
+                continue
+    return None
+
+async def run_client(client: httpx.AsyncClient, index: int, args, directives: List[Dict[str, Any]], chats: List[Dict[str, Any]]):
+    with open(args.body) as f:
+        case_facts = json.load(f)["case_facts"]
+    for n in range(args.requests):
+        facts = case_facts if args.same_facts else f"{case_facts} (client {index}, run {n})"
+        body = {"case_facts": facts, "stream_format": args.stream_format}
+        marker = "=== PART 1 ===" if args.stream_format == "text" else '"type":"part"'
+        sample = await stream_request(client, "/generate_directive", body, first_part_marker=marker)
+        complete = "WAR-GAME-DIRECTIVE-COMPLETE" in sample["text"] or '"type":"done"' in sample["text"]
+        sample["ok"] = sample["ok"] and complete
+        directives.append(sample)
+        conversation_id = conversation_id_from(sample["text"])
+        sample["text"] = ""
+        for turn in range(args.chat_turns if conversation_id else 0):
+            chat = await stream_request(client, "/chat", {"query": f"What is the strongest argument? ({turn})",
+                                                          "conversation_id": conversation_id})
+            chat["ok"] = chat["ok"] and "[ERROR]" not in chat["text"]
+            chat["text"] = ""
+            chats.append(chat)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def run(args) -> Dict[str, Any]:
+    fake_search = install_fakes(
+        llm=dict(latency=args.llm_latency, jitter=args.llm_jitter, chunk_delay=args.chunk_delay,
+                 error_rate=args.llm_error_rate, seed=args.seed),
+        search=dict(latency=args.search_latency, jitter=args.search_jitter,
+                    error_rate=args.search_error_rate, seed=args.seed),
+    )
+    import directive_cache
+    import main
+
+    # every client sends distinct facts unless --same-facts, but a warm cache from
+    # an earlier run in this process would still turn requests into replays
+    directive_cache.DIRECTIVE_CACHE_ENABLED = args.directive_cache
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            server_task.result()
+        await asyncio.sleep(0.05)
+
+    directives: List[Dict[str, Any]] = []
+    chats: List[Dict[str, Any]] = []
+    limits = httpx.Limits(max_connections=args.clients * 2, max_keepalive_connections=args.clients)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout, limits=limits) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(run_client(client, i, args, directives, chats) for i in range(args.clients)))
+            wall = time.perf_counter() - start
+            metrics_text = (await client.get("/metrics")).text if args.metrics else None
+    finally:
+        server.should_exit = True
+        await server_task
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "wall_seconds": round(wall, 3),
+        "generate_directive": summarize("generate_directive", directives, wall),
+        "search_calls": fake_search.calls,
+    }
+    if chats:
+        report["chat"] = summarize("chat", chats, wall)
+    if metrics_text is not None:
+        report["metrics"] = metrics_text
+    return report
+
+def print_report(report: Dict[str, Any]):
+    print(f"wall time {report['wall_seconds']}s, fake search calls {report['search_calls']}")
+    for key in ("generate_directive", "chat"):
+        s = report.get(key)
+        if not s:
+            continue
+        print(f"\n{key}: {s['ok']}/{s['requests']} ok, {s['errors']} errors, {s['throughput_rps']} req/s, {s['bytes']} bytes")
+        for metric in ("ttfb", "first_part", "total"):
+            row = [s.get(f"{metric}_p{p}") for p in (50, 95, 99)]
+            if any(v is not None for v in row):
+                print(f"  {metric:<10} p50={row[0]}s p95={row[1]}s p99={row[2]}s")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10, help="concurrent simulated clients")
+    parser.add_argument("--requests", type=int, default=1, help="directives per client")
+    parser.add_argument("--chat-turns", type=int, default=0, help="chat questions per directive")
+    parser.add_argument("--stream-format", choices=("text", "json", "ndjson"), default="text")
+    parser.add_argument("--body", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "body.json"))
+    parser.add_argument("--same-facts", action="store_true", help="every client sends identical facts (exercises single-flight)")
+    parser.add_argument("--directive-cache", action="store_true", help="keep the whole-directive cache enabled")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--chunk-delay", type=float, default=0.01)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--search-jitter", type=float, default=0.1)
+    parser.add_argument("--search-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--metrics", action="store_true", help="include the server's /metrics text in the JSON report")
+    parser.add_argument("--output", help="also write the report as JSON to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
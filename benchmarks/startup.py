@@ -0,0 +1,111 @@
+# benchmarks/startup.py
+"""
+Cold-start benchmark: measures, in fresh interpreter processes, how long
+`import main` takes and how long the FastAPI lifespan needs before the worker
+can serve, for each WARMUP_ON_STARTUP mode.
+
+    python -m benchmarks.startup --runs 5 --modes 0 1 --importtime
+
+Run from the repository root. "ping" mode sends a real request to the chat
+model, so only use it with API keys configured.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child process; prints one JSON line with its timings
+_CHILD = r"""
+import json, time, asyncio
+t0 = time.perf_counter()
+import main
+imported = time.perf_counter() - t0
+
+async def startup():
+    t1 = time.perf_counter()
+    async with main.lifespan(main.app):
+        ready = time.perf_counter() - t1
+        warmup = getattr(main.app.state, "warmup", {})
+    return ready, warmup
+
+ready, warmup = asyncio.run(startup())
+print(json.dumps({"import": imported, "lifespan": ready, "total": imported + ready, "warmup": warmup}))
+"""
+
+def run_child(mode: str, importtime: bool = False) -> Dict[str, Any]:
+    env = dict(os.environ, WARMUP_ON_STARTUP=mode, PYTHONDONTWRITEBYTECODE="1")
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", _CHILD]
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"startup run failed (mode {mode}):\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    if importtime:
+        result["slowest_imports"] = slowest_imports(proc.stderr)
+    return result
+
+def slowest_imports(stderr: str, top: int = 15) -> List[Dict[str, Any]]:
+    """Top-level packages by cumulative import time, from `python -X importtime` output."""
+    totals: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            cumulative_us = int(cumulative)
+        except ValueError:
+            continue
+        # nested imports are indented further; only count the top-level ones
+        name = name.rstrip()
+        if name.startswith(" ") and not name.startswith("  "):
+            root = name.strip().split(".")[0]
+            totals[root] = totals.get(root, 0) + cumulative_us
+    ranked = sorted(totals.items(), key=lambda item: -item[1])[:top]
+    return [{"module": name, "ms": round(us / 1000, 1)} for name, us in ranked]
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {}
+    for key in ("import", "lifespan", "total"):
+        values = [s[key] for s in samples]
+        summary[key] = {
+            "median_s": round(statistics.median(values), 4),
+            "min_s": round(min(values), 4),
+            "max_s": round(max(values), 4),
+        }
+    summary["warmup"] = samples[-1].get("warmup", {})
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per mode")
+    parser.add_argument("--modes", nargs="+", default=["0", "1"], help="WARMUP_ON_STARTUP values to compare")
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest top-level imports")
+    parser.add_argument("--output", help="also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for mode in args.modes:
+        samples = [run_child(mode) for _ in range(max(1, args.runs))]
+        report[mode] = summarize(samples)
+        if args.importtime:
+            report[mode]["slowest_imports"] = run_child(mode, importtime=True)["slowest_imports"]
+
+    for mode, summary in report.items():
+        print(f"WARMUP_ON_STARTUP={mode}")
+        for key in ("import", "lifespan", "total"):
+            s = summary[key]
+            print(f"  {key:<9} median={s['median_s']}s min={s['min_s']}s max={s['max_s']}s")
+        if summary["warmup"]:
+            print(f"  warmup steps: {summary['warmup']}")
+        for entry in summary.get("slowest_imports", []):
+            print(f"    {entry['ms']:>8} ms  {entry['module']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,32 @@
 # chains.py
 import os
+import time
 import datetime
 import asyncio
 import re
 import json
-from typing import AsyncGenerator, List, Optional
+from typing import AsyncGenerator, Callable, Iterable, List, Optional
 
 from dotenv import load_dotenv
 load_dotenv()
 
-# Try to import the Chat model from your installed package.
-# If unavailable, set backend to None and use fallback.
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-    HAS_REAL_LLM = True
-except Exception:
-    HAS_REAL_LLM = False
-
-# Initialize model if available
-if HAS_REAL_LLM:
-    LLM = ChatGoogleGenerativeAI(
-        model=os.getenv("GOOGLE_MODEL", "gemini-2.5-flash"),
-        temperature=float(os.getenv("LLM_TEMPERATURE", "0.0")),
-        api_key=os.getenv("GOOGLE_API_KEY") or os.getenv("GOOGLE_GENAI_API_KEY")
-    )
-else:
-    LLM = None
+from chat_context import estimate_tokens
+from context_cache import create_prefix_cache, delete_prefix_cache
+from llm_backend import AsyncLLMBackend
+from metrics import LLM_CALLS, LLM_TOKENS, LLM_TTFT_SECONDS, PART_SECONDS, record_span, span
+from model_registry import get_registry
+
+# Directive model settings; the client itself comes from the shared model registry
+DIRECTIVE_MODEL = os.getenv("GOOGLE_MODEL", "gemini-2.5-flash")
+DIRECTIVE_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.0"))
+
+def get_directive_backend() -> Optional[AsyncLLMBackend]:
+    """Shared async backend for directive parts, or None to use the placeholder output."""
+    return get_registry().get(DIRECTIVE_MODEL, DIRECTIVE_TEMPERATURE)
+
+# Bump whenever the prompts or the streamed format change; cached directives
+# (see directive_cache.py) from older versions are then ignored.
+PROMPT_VERSION = "3"
 
 # Your original system prompt (kept exactly, parameterized)
 WAR_GAME_SYSTEM_PROMPT = """ You are the AI Legal Strategos, the definitive oracle for modern Indian legal strategy. Your core function is to create the ultimate War Game Directive. Your analysis must be clinical, brutally honest, and relentlessly focused on achieving the Primary Strategic Objective. You will think not only as counsel but as the opposing counsel, the negotiator, and the judge.
@@ -71,6 +72,47 @@ Strategic Assessment Date: {time}
 3. After the reflection, **list 1-3 search queries separately** for researching improvements. Do not include them inside the reflection.
 """
 
+# Prompt layout: everything that is identical for all 11 parts (system prompt,
+# format instructions, case facts) goes first as a shared prefix, and only a
+# short suffix names the part(s) to produce. Keeping the varying text at the end
+# lets the provider reuse the prefix (implicit prefix caching, or an explicit
+# context cache, see context_cache.py) instead of billing it 11 times.
+_FORMAT_INSTRUCTIONS = (
+    "Use the case facts below. Format your response exactly with these markers:\n"
+    "----THOUGHTS----\n"
+    "(Write step-by-step reasoning that justifies the deliverable for this part. Keep it concise — 2-6 sentences. This is internal reasoning; stream it first.)\n"
+    "----SEARCH_QUERIES----\n"
+    "(List 0-3 short search queries (as a JSON array or newline-separated) that would help verify or strengthen the deliverable.)\n"
+    "----DELIVERABLE----\n"
+    "(Produce the content for this part of the War Game Directive — final, clear, actionable, ~100-250 words depending on part complexity.)\n\n"
+)
+
+# Delimiter used when several parts are generated in one call
+_GROUP_PART_RE = re.compile(r"====\s*PART\s+(\d+)\s*====", re.I)
+# Matches an incomplete delimiter at the very end of the received text
+_GROUP_PARTIAL_RE = re.compile(r"={1,4}(?:\s*(?:P(?:A(?:R(?:T(?:\s+(?:\d+\s*={0,3})?)?)?)?)?)?)?$", re.I)
+
+def build_prompt_prefix(case_facts: str, time: str, first_instruction: str) -> str:
+    """The part-independent head of every part prompt for one directive."""
+    system = WAR_GAME_SYSTEM_PROMPT.format(time=time, first_instruction=first_instruction)
+    return f"{system}\n\n{_FORMAT_INSTRUCTIONS}CASE FACTS:\n{case_facts}"
+
+def build_part_suffix(parts) -> str:
+    """The per-call tail: one part number, or a list of parts to produce in one response."""
+    if isinstance(parts, int) or len(parts) == 1:
+        part_number = parts if isinstance(parts, int) else parts[0]
+        return (
+            f"PART {part_number} — Please produce only the THOUGHTS, SEARCH_QUERIES, and DELIVERABLE for this single numbered part.\n"
+            f"Now produce the three sections for PART {part_number} only."
+        )
+    numbers = ", ".join(str(p) for p in parts)
+    return (
+        f"PARTS {numbers} — Produce the THOUGHTS, SEARCH_QUERIES, and DELIVERABLE for each of these numbered parts, in order.\n"
+        "Start each part with its own line of the form ====PART n==== (for example ====PART "
+        f"{parts[0]}====), followed by that part's three marked sections.\n"
+        f"Now produce PARTS {numbers} only."
+    )
+
 # Helper: build the per-part prompt (we call this for each of 11 parts).
 def build_part_prompt(case_facts: str, part_number: int, time: str, first_instruction: str):
     """
@@ -80,20 +122,8 @@ def build_part_prompt(case_facts: str, part_number: int, time: str, first_instru
       ---DELIVERABLE---  (the final text for this part)
     We will parse by those markers.
     """
-    part_header = f"PART {part_number} — Please produce only the THOUGHTS, SEARCH_QUERIES, and DELIVERABLE for this single numbered part.\n"
-    system = WAR_GAME_SYSTEM_PROMPT.format(time=time, first_instruction=first_instruction)
-    instructions = (
-        part_header +
-        "\nUse the case facts below. Format your response exactly with these markers:\n"
-        "----THOUGHTS----\n"
-        "(Write step-by-step reasoning that justifies the deliverable for this part. Keep it concise — 2-6 sentences. This is internal reasoning; stream it first.)\n"
-        "----SEARCH_QUERIES----\n"
-        "(List 0-3 short search queries (as a JSON array or newline-separated) that would help verify or strengthen the deliverable.)\n"
-        "----DELIVERABLE----\n"
-        "(Produce the content for this part of the War Game Directive — final, clear, actionable, ~100-250 words depending on part complexity.)\n\n"
-    )
-    prompt = f"{system}\n\n{instructions}\nCASE FACTS:\n{case_facts}\n\nNow produce the three sections for PART {part_number} only."
-    return prompt
+    prefix = build_prompt_prefix(case_facts, time, first_instruction)
+    return f"{prefix}\n\n{build_part_suffix(part_number)}"
 
 # Simple parser to extract sections
 _SECTION_RE = re.compile(r"----THOUGHTS----\s*(.*?)\s*----SEARCH_QUERIES----\s*(.*?)\s*----DELIVERABLE----\s*(.*)", re.S | re.I)
@@ -142,109 +172,533 @@ def try_parse_queries(raw: str) -> List[str]:
     # nothing
     return []
 
+# Incremental parsing of a streamed response. The model emits the same three
+# markers as above, but we want to forward each section while it is still being
+# generated instead of waiting for the full text.
+_MARKER_RE = re.compile(r"----(THOUGHTS|SEARCH_QUERIES|DELIVERABLE)----", re.I)
+_MARKERS = ("----THOUGHTS----", "----SEARCH_QUERIES----", "----DELIVERABLE----")
+_MARKER_SECTIONS = {"THOUGHTS": "thoughts", "SEARCH_QUERIES": "queries", "DELIVERABLE": "deliverable"}
+
+def _partial_marker_len(text: str) -> int:
+    """Length of the longest suffix of text that could be the start of a marker."""
+    upper = text.upper()
+    for k in range(min(len(text), max(len(m) for m in _MARKERS) - 1), 0, -1):
+        tail = upper[-k:]
+        if any(m.startswith(tail) for m in _MARKERS):
+            return k
+    return 0
+
+class SectionStreamParser:
+    """
+    Streaming counterpart of parse_model_sections.
+    feed() takes raw chunks as they arrive and returns a list of events:
+      ("begin", section)        a marker was seen
+      ("text", section, text)   body text (stripped like parse_model_sections)
+      ("end", section)          the next marker arrived or the stream closed
+    Sections are "thoughts", "queries" and "deliverable". Text before the first
+    marker is held back; if no marker ever shows up it is released as the
+    deliverable on close(), matching the non-streaming fallback.
+    """
+
+    def __init__(self):
+        self.section = None
+        self._pending = ""
+        self._preamble = []
+        self._started = False
+        self._trailing_ws = ""
+
+    def feed(self, chunk: str) -> list:
+        events = []
+        self._pending += chunk
+        while True:
+            m = _MARKER_RE.search(self._pending)
+            if not m:
+                break
+            self._emit_text(self._pending[:m.start()], events)
+            if self.section is not None:
+                events.append(("end", self.section))
+            self.section = _MARKER_SECTIONS[m.group(1).upper()]
+            self._preamble = []
+            self._started = False
+            self._trailing_ws = ""
+            events.append(("begin", self.section))
+            self._pending = self._pending[m.end():]
+        # hold back anything that might be the first half of a split marker
+        keep = _partial_marker_len(self._pending)
+        self._emit_text(self._pending[:len(self._pending) - keep], events)
+        self._pending = self._pending[len(self._pending) - keep:]
+        return events
+
+    def close(self) -> list:
+        events = []
+        self._emit_text(self._pending, events)
+        self._pending = ""
+        if self.section is not None:
+            events.append(("end", self.section))
+        else:
+            # As a last resort, treat the whole text as deliverable
+            text = "".join(self._preamble).strip()
+            if text:
+                events.extend([("begin", "deliverable"), ("text", "deliverable", text), ("end", "deliverable")])
+        self.section = None
+        return events
+
+    def _emit_text(self, text: str, events: list):
+        if not text:
+            return
+        if self.section is None:
+            self._preamble.append(text)
+            return
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return
+            self._started = True
+        # trailing whitespace is only released once more text follows it
+        text = self._trailing_ws + text
+        body = text.rstrip()
+        self._trailing_ws = text[len(body):]
+        if body:
+            events.append(("text", self.section, body))
+
+# Directive stream events. generate_directive_events() yields plain dicts:
+#   {"type": "part", "part": n, "status": "start"|"end"}
+#   {"type": "section", "part": n, "section": "thoughts"|"queries"|"deliverable",
+#    "status": "begin"|"end"|"none"}            (queries "end" also has "queries": [...])
+#   {"type": "delta", "part": n, "section": ..., "text": "..."}
+#   {"type": "tool_result", "part": n, "query": q, "results": [{title, url, snippet}], "answer"?: ...}
+#                                               (or "error": "..." instead of results)
+#   {"type": "error", "part"?: n, "message": "..."}
+#   {"type": "done", "parts": 11}
+# Every event also carries "t", milliseconds since the directive started.
+# render_text_event() turns them into the original plain-text protocol.
+_NONE_TEXT = {
+    "thoughts": "[THOUGHTS: none]\n",
+    "queries": "[SEARCH_QUERIES: none]\n",
+    "deliverable": "[DELIVERABLE: none]\n",
+}
+
+def render_text_event(event: dict) -> str:
+    """Plain-text (marker line) form of one directive event."""
+    kind = event["type"]
+    if kind == "delta":
+        return event["text"]
+    if kind == "part":
+        return f"=== PART {event['part']} ===\n" if event["status"] == "start" else "\n"
+    if kind == "section":
+        section, status = event["section"], event["status"]
+        if status == "none":
+            return _NONE_TEXT[section]
+        if section == "queries":
+            if status == "begin":
+                return ""
+            return "[SEARCH_QUERIES]\n" + "".join(f"- {q}\n" for q in event["queries"])
+        tag = "THOUGHTS" if section == "thoughts" else "DELIVERABLE"
+        return f"[{tag}-BEGIN]\n" if status == "begin" else f"[{tag}-END]\n"
+    if kind == "tool_result":
+        if event.get("query") is None:
+            # execute_tools itself failed rather than a single query
+            return f"[TOOL-ERROR] {event.get('error')}\n"
+        if event.get("error"):
+            body = f"(search error) {event['error']}"
+        else:
+            payload = {key: event[key] for key in ("answer", "results") if key in event}
+            body = json.dumps(payload, ensure_ascii=False)
+        return f"[TOOL-RESULT-BEGIN] {event['query']}\n{body}\n[TOOL-RESULT-END] {event['query']}\n"
+    if kind == "error":
+        return f"[ERROR] {event['message']}\n"
+    if kind == "done":
+        return "[WAR-GAME-DIRECTIVE-COMPLETE]\n"
+    return ""
+
+class _PartEmitter:
+    """Turns SectionStreamParser events for one part into directive stream events."""
+
+    _ORDER = ("thoughts", "queries", "deliverable")
+
+    def __init__(self, part: int):
+        self.part = part
+        self.done = set()
+        self.current = None
+        self.line_open = False
+        self.query_text = []
+        self.deliverable_text = []
+        # set once the SEARCH_QUERIES section is closed (or skipped)
+        self.queries: Optional[List[str]] = None
+
+    def _section(self, section: str, status: str, **extra) -> dict:
+        return dict(type="section", part=self.part, section=section, status=status, **extra)
+
+    def _skip_to(self, section: Optional[str]) -> List[dict]:
+        out = []
+        for s in self._ORDER:
+            if s == section:
+                break
+            if s not in self.done:
+                self.done.add(s)
+                if s == "queries":
+                    self.queries = []
+                out.append(self._section(s, "none"))
+        return out
+
+    def handle(self, event: tuple) -> List[dict]:
+        kind, section = event[0], event[1]
+        if kind == "begin":
+            out = self._skip_to(section)
+            self.current = section
+            self.line_open = False
+            out.append(self._section(section, "begin"))
+            return out
+        if kind == "text":
+            if section == "queries":
+                self.query_text.append(event[2])
+                return []
+            if section == "deliverable":
+                self.deliverable_text.append(event[2])
+            self.line_open = not event[2].endswith("\n")
+            return [{"type": "delta", "part": self.part, "section": section, "text": event[2]}]
+        # end of a section
+        self.done.add(section)
+        self.current = None
+        if section == "queries":
+            self.queries = try_parse_queries("".join(self.query_text))
+            if not self.queries:
+                return [self._section("queries", "none")]
+            return [self._section("queries", "end", queries=self.queries)]
+        out = []
+        if self.line_open:
+            # keep the END marker on its own line in the text protocol
+            out.append({"type": "delta", "part": self.part, "section": section, "text": "\n"})
+        self.line_open = False
+        out.append(self._section(section, "end"))
+        return out
+
+    def finish(self) -> List[dict]:
+        return self._skip_to(None)
+
+# Concurrency limits for part generation.
+# DIRECTIVE_PART_CONCURRENCY caps how many LLM calls of one directive run at once
+# (1 restores the old part-by-part behaviour). LLM_MAX_CONCURRENT_PARTS caps the
+# total number of directive LLM calls in flight across the whole process, so
+# several simultaneous directives still stay under the provider's rate limits.
+# DIRECTIVE_PARTS_PER_CALL > 1 asks for several consecutive parts in a single
+# structured call, sending the shared prompt prefix once per group instead of
+# once per part (useful when the backend has no context caching).
+TOTAL_PARTS = 11
+DIRECTIVE_PART_CONCURRENCY = max(1, int(os.getenv("DIRECTIVE_PART_CONCURRENCY", str(TOTAL_PARTS))))
+LLM_MAX_CONCURRENT_PARTS = max(1, int(os.getenv("LLM_MAX_CONCURRENT_PARTS", "16")))
+DIRECTIVE_PARTS_PER_CALL = max(1, int(os.getenv("DIRECTIVE_PARTS_PER_CALL", "1")))
+_PROCESS_PART_SEMAPHORE = asyncio.Semaphore(LLM_MAX_CONCURRENT_PARTS)
+
+# Sentinel pushed onto a part's queue once that part has finished streaming
+_PART_DONE = object()
+
+def _dummy_output(case_facts: str, part: int) -> str:
+    # fallback dummy output
+    dummy_thoughts = f"(internal reasoning placeholder for part {part})"
+    dummy_queries = [f"{case_facts.split('.')[0][:80]} structural defect law India"]  # 1 sample
+    dummy_deliverable = f"(Deliverable placeholder for part {part} based on the facts.)"
+    # assemble with markers so parser works
+    return f"----THOUGHTS----\n{dummy_thoughts}\n----SEARCH_QUERIES----\n{json.dumps(dummy_queries)}\n----DELIVERABLE----\n{dummy_deliverable}"
+
+async def _llm_chunks(backend: Optional[AsyncLLMBackend], case_facts: str, parts: List[int], prefix: str,
+                      cache_name: Optional[str], directive_sem: asyncio.Semaphore) -> AsyncGenerator[str, None]:
+    """Raw text chunks for one LLM call covering `parts`, straight from the provider's token stream."""
+    label = ",".join(map(str, parts))
+    with span("prompt", part=label):
+        suffix = build_part_suffix(parts)
+    queued = time.perf_counter()
+    async with directive_sem, _PROCESS_PART_SEMAPHORE:
+        # time spent waiting for a concurrency slot
+        record_span("llm_queue", queued, time.perf_counter() - queued, part=label)
+        if backend is None:
+            if len(parts) == 1:
+                yield _dummy_output(case_facts, parts[0])
+            else:
+                yield "".join(f"====PART {p}====\n{_dummy_output(case_facts, p)}\n" for p in parts)
+            return
+        if cache_name:
+            # the prefix already lives in the provider's context cache
+            stream = backend.astream(suffix, cached_content=cache_name)
+        else:
+            stream = backend.astream(f"{prefix}\n\n{suffix}")
+        LLM_TOKENS.inc(estimate_tokens(suffix if cache_name else prefix + suffix), model=DIRECTIVE_MODEL, direction="prompt")
+        start = time.perf_counter()
+        first = None
+        output: List[str] = []
+        outcome = "error"
+        try:
+            async for chunk in stream:
+                if first is None:
+                    first = time.perf_counter()
+                    LLM_TTFT_SECONDS.observe(first - start, model=DIRECTIVE_MODEL)
+                    record_span("llm_ttft", start, first - start, part=label)
+                output.append(chunk)
+                yield chunk
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "abandoned"
+            raise
+        finally:
+            LLM_CALLS.inc(model=DIRECTIVE_MODEL, outcome=outcome)
+            LLM_TOKENS.inc(estimate_tokens("".join(output)), model=DIRECTIVE_MODEL, direction="completion")
+            record_span("llm", start, time.perf_counter() - start, part=label, outcome=outcome)
+
+class _GroupedCall:
+    """
+    Runs one LLM call that produces several parts and splits its token stream
+    on the ====PART n==== delimiters, so each part can be parsed and streamed
+    exactly like a single-part call.
+    """
+
+    def __init__(self, parts: List[int]):
+        self.queues = {p: asyncio.Queue() for p in parts}
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self, source: AsyncGenerator[str, None]):
+        self.task = asyncio.create_task(self._run(source))
+
+    async def _run(self, source: AsyncGenerator[str, None]):
+        current = None
+        pending = ""
+        try:
+            async for chunk in source:
+                pending += chunk
+                while True:
+                    m = _GROUP_PART_RE.search(pending)
+                    if not m:
+                        break
+                    if current is not None and m.start():
+                        await current.put(pending[:m.start()])
+                    current = self.queues.get(int(m.group(1)))
+                    pending = pending[m.end():]
+                # keep a possible half-received delimiter for the next chunk
+                m = _GROUP_PARTIAL_RE.search(pending)
+                cut = m.start() if m else len(pending)
+                if current is not None and cut:
+                    await current.put(pending[:cut])
+                # text before the first delimiter is dropped
+                pending = pending[cut:]
+            if current is not None and pending:
+                await current.put(pending)
+        except Exception as e:
+            for queue in self.queues.values():
+                await queue.put(e)
+        finally:
+            for queue in self.queues.values():
+                await queue.put(_PART_DONE)
+
+    async def chunks(self, part: int) -> AsyncGenerator[str, None]:
+        queue = self.queues[part]
+        while True:
+            item = await queue.get()
+            if item is _PART_DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+async def _collect_search(queries: List[str], results: asyncio.Queue, search_tasks: Optional[dict] = None):
+    """Runs the part's search queries in the background, pushing (query, result, error) items."""
+    start = time.perf_counter()
+    try:
+        # Import execute_tools here to avoid circular import at module level
+        from execute_tools import run_search_queries
+        async for q, result in run_search_queries(queries, search_tasks):
+            await results.put((q, result, None))
+    except Exception as e:
+        await results.put((None, None, e))
+    finally:
+        record_span("search", start, time.perf_counter() - start, queries=len(queries))
+        await results.put(_PART_DONE)
+
+async def _part_stream(part: int, chunks: AsyncGenerator[str, None], search_tasks: Optional[dict] = None,
+                       on_deliverable: Optional[Callable[[int, str], None]] = None) -> AsyncGenerator[dict, None]:
+    """
+    Yields the events for a single numbered part, parsed from `chunks` (the raw
+    model output for this part).
+    THOUGHTS and DELIVERABLE text is forwarded as the model produces it. Search
+    queries start running as soon as their section closes, in parallel with the
+    deliverable, and their results are streamed right after the deliverable.
+    on_deliverable(part, text) is called with the finished deliverable unless
+    the LLM call failed.
+    """
+    yield {"type": "part", "part": part, "status": "start"}
+
+    parser = SectionStreamParser()
+    emitter = _PartEmitter(part)
+    search_results = asyncio.Queue()
+    search_task = None
+    llm_failed = False
+    parse_seconds = 0.0
+    parse_started = time.perf_counter()
+    try:
+        try:
+            async for chunk in chunks:
+                t0 = time.perf_counter()
+                events = [out for event in parser.feed(chunk) for out in emitter.handle(event)]
+                parse_seconds += time.perf_counter() - t0
+                for out in events:
+                    yield out
+                if search_task is None and emitter.queries:
+                    search_task = asyncio.create_task(_collect_search(emitter.queries, search_results, search_tasks))
+        except Exception as e:
+            llm_failed = True
+            # surface the failure as (part of) the deliverable, as the parser would
+            if emitter.current == "deliverable" or "deliverable" in emitter.done:
+                error_text = f"\n[LLM ERROR] {e}"
+            else:
+                error_text = f"\n----DELIVERABLE----\n[LLM ERROR] {e}"
+            for event in parser.feed(error_text):
+                for out in emitter.handle(event):
+                    yield out
+        for event in parser.close():
+            for out in emitter.handle(event):
+                yield out
+        for out in emitter.finish():
+            yield out
+        # CPU time spent parsing this part's output, recorded as one span
+        record_span("parse", parse_started, parse_seconds, part=part)
+        if on_deliverable is not None and not llm_failed and emitter.deliverable_text:
+            try:
+                on_deliverable(part, "".join(emitter.deliverable_text))
+            except Exception:
+                # capturing the deliverable must never break the stream
+                pass
+
+        # Search results (Tavily) for this part's queries
+        if search_task is None and emitter.queries:
+            search_task = asyncio.create_task(_collect_search(emitter.queries, search_results, search_tasks))
+        if search_task is not None:
+            while True:
+                item = await search_results.get()
+                if item is _PART_DONE:
+                    break
+                q, result, err = item
+                if err is not None:
+                    # execute_tools isn't available or errored as a whole
+                    yield {"type": "tool_result", "part": part, "query": None, "error": str(err)}
+                    continue
+                yield dict({"type": "tool_result", "part": part, "query": q}, **result)
+    finally:
+        if search_task is not None and not search_task.done():
+            search_task.cancel()
+        # release the LLM slot even if we stopped reading early
+        await chunks.aclose()
+
+    yield {"type": "part", "part": part, "status": "end"}
+
+async def _run_part(part: int, part_gen: AsyncGenerator[dict, None], queue: asyncio.Queue, started: float):
+    """Drains one part's generator into its queue, stamping each event with its time offset."""
+    loop = asyncio.get_running_loop()
+    # every part task starts with the directive, so the part's own clock starts
+    # at its first model output; time spent waiting for an LLM slot or for
+    # earlier parts of a grouped call is left out
+    part_started = None
+    try:
+        async for event in part_gen:
+            now = loop.time()
+            event["t"] = round((now - started) * 1000)
+            if part_started is None and event["type"] != "part":
+                part_started = now
+            await queue.put(event)
+        if part_started is not None:
+            PART_SECONDS.observe(loop.time() - part_started, part=part)
+    except Exception as e:
+        await queue.put({"type": "error", "part": part, "message": str(e), "t": round((loop.time() - started) * 1000)})
+    finally:
+        await queue.put(_PART_DONE)
+
 # The async generator that orchestrates parts, LLM calls and tool executions
-async def generate_full_directive_stream(case_facts: str, first_instruction: Optional[str] = None) -> AsyncGenerator[str, None]:
+async def generate_directive_events(case_facts: str, first_instruction: Optional[str] = None, concurrency: Optional[int] = None,
+                                    on_deliverable: Optional[Callable[[int, str], None]] = None,
+                                    parts_per_call: Optional[int] = None,
+                                    parts: Optional[Iterable[int]] = None) -> AsyncGenerator[dict, None]:
     """
-    Yields strings representing small pieces to be streamed (each will be sent as SSE data lines).
+    Yields the directive as typed events (see render_text_event for the list).
     Sequence for each part:
-      - header line "PART n"
-      - LLM THOUGHTS lines (streamed)
-      - (if any) SEARCH_QUERIES lines
-      - TAVILY results streamed (each result chunk)
-      - DELIVERABLE lines (streamed)
+      - part start
+      - THOUGHTS section (streamed token by token as deltas)
+      - SEARCH_QUERIES section
+      - DELIVERABLE section (streamed token by token as deltas)
+      - one tool_result per search query
+      - part end
+
+    Parts are generated concurrently (up to `concurrency` LLM calls, default
+    DIRECTIVE_PART_CONCURRENCY) but always streamed in order 1..11: part N is
+    forwarded live once every earlier part has been sent, and anything it
+    produced in the meantime is flushed from its queue first. With
+    `parts_per_call` > 1 consecutive parts share one structured LLM call.
+
+    on_deliverable(part, text), if given, receives each finished deliverable so
+    callers can keep the directive without re-parsing the stream.
+
+    `parts` restricts generation to those part numbers (e.g. when revising a
+    directive); the others are not requested at all.
     """
+    selected = sorted({p for p in parts if 1 <= p <= TOTAL_PARTS}) if parts is not None else list(range(1, TOTAL_PARTS + 1))
     if first_instruction is None:
         first_instruction = "User will give you all info about the case. Analyse it thoroughly and explain each and every point in detail. Highlight important points."
 
+    loop = asyncio.get_running_loop()
+    started = loop.time()
     now = datetime.datetime.now().isoformat()
-    total_parts = 11
+    directive_sem = asyncio.Semaphore(max(1, concurrency or DIRECTIVE_PART_CONCURRENCY))
+    group_size = max(1, parts_per_call or DIRECTIVE_PARTS_PER_CALL)
 
-    for part in range(1, total_parts + 1):
-        header = f"=== PART {part} ===\n"
-        yield header
+    # Shared prompt prefix, uploaded once as a provider context cache when enabled
+    backend = get_directive_backend()
+    with span("prompt", part="prefix"):
+        prefix = build_prompt_prefix(case_facts, now, first_instruction)
+    cache_name = await create_prefix_cache(DIRECTIVE_MODEL, prefix) if backend is not None and selected else None
 
-        # Build prompt for this specific part
-        part_prompt = build_part_prompt(case_facts, part, now, first_instruction)
+    # normalized query -> search task, shared by all parts so duplicates run once
+    search_tasks = {}
 
-        # Call LLM (sync or async) and get raw text
-        raw = None
-        if LLM is not None:
-            try:
-                # prefer .invoke or .generate depending on package
-                if hasattr(LLM, "invoke"):
-                    resp = LLM.invoke(part_prompt)
-                    raw = str(resp)
-                elif hasattr(LLM, "generate"):
-                    resp = LLM.generate([{"role": "user", "content": part_prompt}])
-                    # try to obtain text safely
-                    gens = getattr(resp, "generations", None)
-                    if gens and len(gens) > 0:
-                        cand = gens[0][0]
-                        raw = getattr(cand, "text", str(cand))
-                    else:
-                        raw = str(resp)
-                else:
-                    # fallback call
-                    raw = str(LLM(part_prompt))
-            except Exception as e:
-                raw = f"[LLM ERROR] {e}"
-        else:
-            # fallback dummy output
-            dummy_thoughts = f"(internal reasoning placeholder for part {part})"
-            dummy_queries = [f"{case_facts.split('.')[0][:80]} structural defect law India"]  # 1 sample
-            dummy_deliverable = f"(Deliverable placeholder for part {part} based on the facts.)"
-            # assemble with markers so parser works
-            raw = f"----THOUGHTS----\n{dummy_thoughts}\n----SEARCH_QUERIES----\n{json.dumps(dummy_queries)}\n----DELIVERABLE----\n{dummy_deliverable}"
-
-        # Parse into sections
-        thoughts, queries, deliverable = parse_model_sections(raw)
-
-        # Stream THOUGHTS (line by line)
-        if thoughts:
-            yield "[THOUGHTS-BEGIN]\n"
-            for line in str(thoughts).splitlines():
-                yield f"{line}\n"
-                await asyncio.sleep(0.01)
-            yield "[THOUGHTS-END]\n"
-        else:
-            yield "[THOUGHTS: none]\n"
-
-        # Stream SEARCH_QUERIES and then execute via execute_tools (which will run Tavily)
-        if queries:
-            yield "[SEARCH_QUERIES]\n"
-            for q in queries:
-                yield f"- {q}\n"
-                await asyncio.sleep(0.005)
-            # Import execute_tools here to avoid circular import at module level
-            try:
-                from execute_tools import run_search_queries  # updated helper below
-                # run_search_queries returns an async generator of (query, result_text)
-                async for q, res_text in run_search_queries(queries):
-                    # stream each query result header + body
-                    yield f"[TOOL-RESULT-BEGIN] {q}\n"
-                    for line in res_text.splitlines():
-                        yield f"{line}\n"
-                        await asyncio.sleep(0.005)
-                    yield f"[TOOL-RESULT-END] {q}\n"
-            except Exception as e:
-                # if execute_tools isn't available or errors, stream an error
-                yield f"[TOOL-ERROR] {e}\n"
-        else:
-            yield "[SEARCH_QUERIES: none]\n"
-
-        # Stream DELIVERABLE (line by line)
-        if deliverable:
-            yield "[DELIVERABLE-BEGIN]\n"
-            for line in str(deliverable).splitlines():
-                yield f"{line}\n"
-                await asyncio.sleep(0.01)
-            yield "[DELIVERABLE-END]\n"
-        else:
-            yield "[DELIVERABLE: none]\n"
+    sources = {}
+    grouped_calls = []
+    for start in range(0, len(selected), group_size):
+        group = selected[start:start + group_size]
+        source = _llm_chunks(backend, case_facts, group, prefix, cache_name, directive_sem)
+        if len(group) == 1:
+            sources[group[0]] = source
+            continue
+        call = _GroupedCall(group)
+        call.start(source)
+        grouped_calls.append(call)
+        for part in group:
+            sources[part] = call.chunks(part)
 
-        # Small separator between parts
-        yield "\n"
-        await asyncio.sleep(0.05)
+    queues = {part: asyncio.Queue() for part in selected}
+    tasks = [
+        asyncio.create_task(_run_part(part, _part_stream(part, sources[part], search_tasks, on_deliverable), queues[part], started))
+        for part in selected
+    ]
+    try:
+        for part in selected:
+            queue = queues[part]
+            while True:
+                event = await queue.get()
+                if event is _PART_DONE:
+                    break
+                yield event
+    finally:
+        # Client went away (or we finished): don't leave parts generating in the background
+        pending = tasks + [call.task for call in grouped_calls] + list(search_tasks.values())
+        for task in pending:
+            if task is not None and not task.done():
+                task.cancel()
+        await delete_prefix_cache(cache_name)
 
     # Final overall wrap
-    yield "[WAR-GAME-DIRECTIVE-COMPLETE]\n"
+    yield {"type": "done", "parts": len(selected), "t": round((loop.time() - started) * 1000)}
+
+async def generate_full_directive_stream(case_facts: str, first_instruction: Optional[str] = None, **kwargs) -> AsyncGenerator[str, None]:
+    """
+    Yields strings representing small pieces to be streamed (each will be sent as SSE data lines):
+    the plain-text rendering of generate_directive_events() (same keyword arguments).
+    """
+    async for event in generate_directive_events(case_facts, first_instruction, **kwargs):
+        text = render_text_event(event)
+        if text:
+            yield text
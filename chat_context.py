@@ -0,0 +1,124 @@
+# chat_context.py
+import os
+import re
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from directive_index import PART_TITLES
+
+# Token budget for the [RETRIEVED CONTEXT] block of a chat prompt. Token counts
+# are estimated at ~4 characters per token, which is close enough for Gemini on
+# English text and avoids a tokenizer round-trip per request.
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "2000"))
+# Separate budget for directive parts retrieved for the current query
+CHAT_RETRIEVAL_TOKEN_BUDGET = int(os.getenv("CHAT_RETRIEVAL_TOKEN_BUDGET", "1200"))
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max(0, max_tokens * 4)
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - 1)].rstrip() + "…"
+
+def _summarize_turn(text: str, max_chars: int = 160) -> str:
+    """Extractive one-line summary of an old answer: its first sentence, capped."""
+    flat = " ".join(text.split())
+    first = _SENTENCE_END_RE.split(flat, maxsplit=1)[0]
+    if len(first) > max_chars:
+        first = first[:max_chars - 1].rstrip() + "…"
+    return first
+
+class ChatContextBuilder:
+    """
+    Keeps a session's rendered chat context up to date incrementally.
+
+    The rendered pieces live in session["context"], so each /chat request only
+    renders the newest turn instead of re-concatenating the whole conversation.
+    When the total goes over the token budget the oldest turns are folded into
+    one-line summaries, and the oldest summaries are dropped once those take
+    more than a quarter of the budget. Case facts may use at most half of it.
+    """
+
+    HEADER = "\nPrevious AI Responses:\n"
+    SUMMARY_HEADER = "Earlier responses (summarized):\n"
+    RETRIEVED_HEADER = "\nRelevant parts of the original directive:\n"
+
+    def __init__(self, token_budget: int = CHAT_CONTEXT_TOKEN_BUDGET, retrieval_budget: int = CHAT_RETRIEVAL_TOKEN_BUDGET):
+        self.token_budget = max(100, int(token_budget))
+        self.retrieval_budget = max(0, int(retrieval_budget))
+
+    def _cache(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        cache = session.get("context")
+        facts = session.get("case_facts", "")
+        digest = hashlib.sha256(facts.encode()).hexdigest()[:16]
+        if cache is None or cache.get("facts_digest") != digest:
+            # first use for this session (or the facts changed): render from scratch
+            rendered_facts = _truncate_to_tokens(facts, self.token_budget // 2)
+            cache = {
+                "facts": rendered_facts,
+                "facts_digest": digest,
+                "summary": [],
+                "turns": [],
+                # the summary header is reserved up front so the total never undercounts
+                "tokens": estimate_tokens(rendered_facts) + estimate_tokens(self.HEADER + self.SUMMARY_HEADER),
+            }
+            session["context"] = cache
+            for entry in session.get("history", []):
+                self._push(cache, str(entry))
+        return cache
+
+    def _push(self, cache: Dict[str, Any], entry: str):
+        line = f"- {_truncate_to_tokens(entry, self.token_budget // 4)}\n"
+        cache["turns"].append(line)
+        cache["tokens"] += estimate_tokens(line)
+        self._enforce_budget(cache)
+
+    def _enforce_budget(self, cache: Dict[str, Any]):
+        turns: List[str] = cache["turns"]
+        summary: List[str] = cache["summary"]
+        while cache["tokens"] > self.token_budget and len(turns) > 1:
+            old = turns.pop(0)
+            cache["tokens"] -= estimate_tokens(old)
+            line = f"- {_summarize_turn(old[2:])}\n"
+            summary.append(line)
+            cache["tokens"] += estimate_tokens(line)
+            summary_tokens = sum(estimate_tokens(s) for s in summary)
+            while summary and summary_tokens > self.token_budget // 4:
+                dropped = summary.pop(0)
+                summary_tokens -= estimate_tokens(dropped)
+                cache["tokens"] -= estimate_tokens(dropped)
+
+    def add_turn(self, session: Dict[str, Any], entry: str):
+        """Records a new AI response in both the session history and the rendered context."""
+        cache = self._cache(session)
+        session.setdefault("history", []).append(entry)
+        self._push(cache, entry)
+
+    def _render_retrieved(self, retrieved: List[Tuple[int, str]]) -> List[str]:
+        if not retrieved or not self.retrieval_budget:
+            return []
+        per_part = self.retrieval_budget // len(retrieved)
+        pieces = [self.RETRIEVED_HEADER]
+        for part, text in retrieved:
+            title = PART_TITLES.get(part, "")
+            pieces.append(f"[Part {part}: {title}]\n{_truncate_to_tokens(text.strip(), per_part)}\n")
+        return pieces
+
+    def build(self, session: Dict[str, Any], retrieved: Optional[List[Tuple[int, str]]] = None) -> str:
+        """
+        Renders the context block. `retrieved` holds (part, deliverable) pairs
+        picked for the current query; they get their own token budget.
+        """
+        cache = self._cache(session)
+        pieces = [cache["facts"]]
+        pieces.extend(self._render_retrieved(retrieved or []))
+        pieces.append(self.HEADER)
+        if cache["summary"]:
+            pieces.append(self.SUMMARY_HEADER)
+            pieces.extend(cache["summary"])
+        pieces.extend(cache["turns"])
+        return "".join(pieces)
@@ -1,6 +1,18 @@
-from typing import AsyncGenerator
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage
+import os
+from typing import AsyncGenerator, Optional
+
+from chat_context import ChatContextBuilder
+from directive_index import retrieve_parts
+from llm_backend import AsyncLLMBackend
+from model_registry import get_registry
+
+# Chat model settings; the client itself comes from the shared model registry
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gemini-2.5-flash")
+CHAT_TEMPERATURE = float(os.getenv("CHAT_TEMPERATURE", "0.2"))
+CHAT_MAX_OUTPUT_TOKENS = int(os.getenv("CHAT_MAX_OUTPUT_TOKENS", "400"))
+
+def get_chat_backend() -> Optional[AsyncLLMBackend]:
+    return get_registry().get(CHAT_MODEL, CHAT_TEMPERATURE, CHAT_MAX_OUTPUT_TOKENS)
 
 # --- System Prompt ---
 CHAT_SYSTEM_PROMPT = """You are the AI Legal Strategos. You have already generated a comprehensive 'War Game Directive' for the user. Your current task is to answer follow-up questions concisely.
@@ -11,6 +23,8 @@ Core Directives:
 - Keep responses concise: 3-4 lines maximum.
 """
 
+CONTEXT_BUILDER = ChatContextBuilder()
+
 def build_chat_prompt(query: str, context: str) -> str:
     """Builds the final prompt for the chat LLM call."""
     return f"{CHAT_SYSTEM_PROMPT}\n\n[RETRIEVED CONTEXT]\n{context}\n\n[USER QUERY]\n{query}"
@@ -18,26 +32,33 @@ def build_chat_prompt(query: str, context: str) -> str:
 async def stream_chat_response(query: str, conversation_id: str, SESSION_STORE) -> AsyncGenerator[str, None]:
     # Retrieve conversation context
     context_data = SESSION_STORE.get(conversation_id, {})
-    context_str = context_data.get("case_facts", "") + "\nPrevious AI Responses:\n"
-    for entry in context_data.get("history", []):
-        context_str += f"- {entry}\n"
+    # Only the directive parts relevant to this query go into the prompt
+    retrieved = retrieve_parts(context_data, query)
+    context_str = CONTEXT_BUILDER.build(context_data, retrieved)
 
     prompt = build_chat_prompt(query, context_str)
 
-    # Initialize LangChain Gemini Chat model
-    chat_model = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.2, max_output_tokens=400)
+    # Shared Gemini chat model (built once in the app lifespan)
+    chat_model = get_chat_backend()
+    if chat_model is None:
+        yield "[ERROR] Gemini API call failed: no chat model available\n"
+        return
 
     try:
-        # Generate response
-        response = chat_model([HumanMessage(content=prompt)])
-        response_text = response.content.strip()
+        # Generate response without blocking the event loop for other streams
+        # a plain string is sent as a single user message; no langchain_core import needed here
+        response = await chat_model.ainvoke(prompt)
+        response_text = response.strip()
     except Exception as e:
         yield f"[ERROR] Gemini API call failed: {e}\n"
         return
 
-    # Save to ephemeral session store
-    context_data.setdefault("history", []).append(response_text)
-    SESSION_STORE[conversation_id] = context_data
+    # Save to the session store (history is capped there; the rendered context is budgeted).
+    # Re-read first: deliverables or other chat turns may have been saved while the
+    # LLM call was awaited, and saving the earlier copy would overwrite them.
+    session = SESSION_STORE.get(conversation_id, {})
+    CONTEXT_BUILDER.add_turn(session, response_text)
+    SESSION_STORE.save(conversation_id, session)
 
     # Stream concise response
     yield response_text
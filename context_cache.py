@@ -0,0 +1,60 @@
+# context_cache.py
+import os
+import asyncio
+import datetime
+from typing import Optional
+
+from chat_context import estimate_tokens
+
+# Explicit Gemini context caching for the shared directive prompt prefix.
+# When enabled, the prefix is uploaded once per directive and each part call
+# sends only its short suffix plus the cache name. Gemini 2.5 models also
+# apply implicit prefix caching, which the prompt layout benefits from even
+# with this switched off.
+DIRECTIVE_CONTEXT_CACHE = os.getenv("DIRECTIVE_CONTEXT_CACHE", "0").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "600"))
+# The API rejects caches below a minimum size; skip the round-trip for short prompts
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+def _create_sync(model: str, prefix: str, ttl: int) -> str:
+    import google.generativeai as genai
+    from google.generativeai import caching
+
+    api_key = os.getenv("GOOGLE_API_KEY") or os.getenv("GOOGLE_GENAI_API_KEY")
+    if api_key:
+        genai.configure(api_key=api_key)
+    name = model if model.startswith("models/") else f"models/{model}"
+    cache = caching.CachedContent.create(
+        model=name,
+        contents=[prefix],
+        ttl=datetime.timedelta(seconds=ttl),
+    )
+    return cache.name
+
+def _delete_sync(cache_name: str):
+    from google.generativeai import caching
+    caching.CachedContent.get(cache_name).delete()
+
+async def create_prefix_cache(model: str, prefix: str) -> Optional[str]:
+    """
+    Uploads prefix as a provider-side context cache and returns its name, or
+    None when caching is disabled, the prefix is too short or the backend does
+    not support it. Callers then send the full prompt as usual.
+    """
+    if not DIRECTIVE_CONTEXT_CACHE or estimate_tokens(prefix) < CONTEXT_CACHE_MIN_TOKENS:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _create_sync, model, prefix, CONTEXT_CACHE_TTL_SECONDS)
+    except Exception:
+        return None
+
+async def delete_prefix_cache(cache_name: Optional[str]):
+    """Best-effort cleanup; the cache expires on its own after CONTEXT_CACHE_TTL_SECONDS anyway."""
+    if not cache_name:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, _delete_sync, cache_name)
+    except Exception:
+        pass
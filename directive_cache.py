@@ -0,0 +1,135 @@
+# directive_cache.py
+import os
+import asyncio
+import hashlib
+import unicodedata
+from typing import AsyncGenerator, Callable, Dict, Optional
+
+from chains import DIRECTIVE_MODEL, DIRECTIVE_TEMPERATURE, PROMPT_VERSION, TOTAL_PARTS, generate_directive_events, render_text_event
+from stream_buffer import StreamBuffer
+from ttl_cache import MISSING, TieredCache
+
+# Whole-directive cache. With temperature 0 the same case facts produce the
+# same directive, so retries and duplicate submissions are served from here
+# instead of re-running 11 LLM calls and their searches.
+DIRECTIVE_CACHE_ENABLED = os.getenv("DIRECTIVE_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+DIRECTIVE_CACHE = TieredCache(
+    max_entries=int(os.getenv("DIRECTIVE_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("DIRECTIVE_CACHE_TTL_SECONDS", str(24 * 3600))),
+    disk_path=os.getenv("DIRECTIVE_CACHE_PATH") or None,
+    disk_max_entries=int(os.getenv("DIRECTIVE_CACHE_DISK_SIZE", "10000")),
+    table="directive_cache",
+)
+
+class _InflightDirective(StreamBuffer):
+    """Buffer of a running generation plus the deliverables and listeners attached to it."""
+
+    def __init__(self):
+        super().__init__()
+        self.deliverables: Dict[int, str] = {}
+        self.listeners = []
+        self.task: Optional[asyncio.Task] = None
+
+# cache key -> generation currently running for it
+_INFLIGHT: Dict[str, _InflightDirective] = {}
+
+def normalize_case_facts(case_facts: str) -> str:
+    """Unicode- and whitespace-insensitive form of the facts used for the cache key."""
+    return " ".join(unicodedata.normalize("NFKC", case_facts).split())
+
+def directive_cache_key(case_facts: str, first_instruction: Optional[str] = None) -> str:
+    raw = "\x1f".join([
+        PROMPT_VERSION,
+        DIRECTIVE_MODEL,
+        repr(DIRECTIVE_TEMPERATURE),
+        normalize_case_facts(first_instruction or ""),
+        normalize_case_facts(case_facts),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def directive_cache_stats():
+    return dict(DIRECTIVE_CACHE.stats(), inflight=len(_INFLIGHT))
+
+async def _produce(key: str, buffer: _InflightDirective, case_facts: str, first_instruction: Optional[str], kwargs: dict):
+    """Runs one generation into `buffer`, independent of whichever client started it."""
+    def capture(part: int, deliverable: str):
+        buffer.deliverables[part] = deliverable
+        for listener in list(buffer.listeners):
+            try:
+                listener(part, deliverable)
+            except Exception:
+                pass
+
+    try:
+        async for event in generate_directive_events(case_facts, first_instruction, on_deliverable=capture, **kwargs):
+            buffer.append(event)
+        complete = len(buffer.deliverables) == TOTAL_PARTS and not any(
+            e["type"] == "tool_result" and e.get("error") for e in buffer.events
+        )
+        if complete:
+            DIRECTIVE_CACHE.set(key, {
+                "events": buffer.events,
+                "deliverables": {str(p): t for p, t in buffer.deliverables.items()},
+            })
+        buffer.close()
+    except asyncio.CancelledError as e:
+        buffer.close(e)
+        raise
+    except Exception as e:
+        buffer.close(e)
+    finally:
+        _INFLIGHT.pop(key, None)
+
+async def cached_directive_events(case_facts: str, first_instruction: Optional[str] = None,
+                                  on_deliverable: Optional[Callable[[int, str], None]] = None,
+                                  **kwargs) -> AsyncGenerator[dict, None]:
+    """
+    Drop-in for generate_directive_events with result caching.
+
+    A cache hit replays the stored event sequence at full speed and reports
+    the stored deliverables through on_deliverable. On a miss, requests for
+    the same key share one in-flight generation: the first starts it, later
+    ones replay what has been produced so far and then follow it live. The
+    generation runs in its own task, so it finishes (and is cached) even if
+    every client disconnects. Only complete directives (all parts delivered,
+    no search errors) are cached.
+    """
+    # partial (revision) runs are not whole directives, so they bypass this cache
+    if not DIRECTIVE_CACHE_ENABLED or kwargs.get("parts") is not None:
+        async for event in generate_directive_events(case_facts, first_instruction, on_deliverable=on_deliverable, **kwargs):
+            yield event
+        return
+
+    key = directive_cache_key(case_facts, first_instruction)
+    cached = DIRECTIVE_CACHE.get(key)
+    if cached is not MISSING:
+        if on_deliverable is not None:
+            for part, deliverable in sorted(cached["deliverables"].items(), key=lambda item: int(item[0])):
+                on_deliverable(int(part), deliverable)
+        for event in cached["events"]:
+            yield event
+        return
+
+    buffer = _INFLIGHT.get(key)
+    if buffer is None:
+        buffer = _InflightDirective()
+        _INFLIGHT[key] = buffer
+        buffer.task = asyncio.create_task(_produce(key, buffer, case_facts, first_instruction, kwargs))
+    if on_deliverable is not None:
+        # catch up on parts finished before we joined, then follow live; the
+        # listener stays attached even if this client disconnects
+        for part, deliverable in sorted(buffer.deliverables.items()):
+            on_deliverable(part, deliverable)
+        buffer.listeners.append(on_deliverable)
+    async for _, event in buffer.subscribe():
+        yield event
+    if buffer.error is not None:
+        yield {"type": "error", "message": str(buffer.error)}
+
+async def cached_directive_stream(case_facts: str, first_instruction: Optional[str] = None,
+                                  **kwargs) -> AsyncGenerator[str, None]:
+    """Drop-in for generate_full_directive_stream: cached_directive_events rendered as text."""
+    async for event in cached_directive_events(case_facts, first_instruction, **kwargs):
+        text = render_text_event(event)
+        if text:
+            yield text
@@ -0,0 +1,153 @@
+# directive_index.py
+import os
+import re
+import math
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+# Titles of the eleven parts, as listed in WAR_GAME_SYSTEM_PROMPT. They are
+# indexed together with each deliverable so "financial exposure" finds part 6
+# even when the text itself never uses those words.
+PART_TITLES = {
+    1: "Mission Briefing",
+    2: "Legal Battlefield Analysis",
+    3: "Asset & Intelligence Assessment (Our Forces)",
+    4: "Red Team Analysis (Simulating the Opposition)",
+    5: "Strategic SWOT Matrix",
+    6: "Financial Exposure & Remedies Analysis",
+    7: "Scenario War Gaming",
+    8: "Leverage Points & Negotiation Gambit",
+    9: "Execution Roadmap",
+    10: "Final Counsel Briefing",
+    11: "Mandatory Disclaimer",
+}
+
+# Parts used when a query shares no terms with any deliverable
+DEFAULT_PARTS = (1, 10)
+
+CHAT_RETRIEVAL_TOP_K = int(os.getenv("CHAT_RETRIEVAL_TOP_K", "3"))
+
+_TOKEN_RE = re.compile(r"[a-z0-9₹]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its my of on or our "
+    "should so than that the their them then there these they this to was we were what when where "
+    "which who why will with would you your".split()
+)
+
+# BM25 parameters
+_K1 = 1.5
+_B = 0.75
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+def index_part(session: Dict[str, Any], part: int, deliverable: str):
+    """
+    Stores a part's deliverable in the session together with its term counts,
+    so retrieval at chat time needs no re-tokenization. Keys are strings so the
+    session stays JSON-serializable for the SQLite store.
+    """
+    parts = session.setdefault("directive_parts", {})
+    index = session.setdefault("directive_index", {})
+    parts[str(part)] = deliverable
+    terms = tokenize(f"{PART_TITLES.get(part, '')} {deliverable}")
+    index[str(part)] = {"tf": dict(Counter(terms)), "len": len(terms)}
+
+def assemble_directive(parts: Dict[Any, str]) -> str:
+    """Joins per-part deliverables (keyed by int or str part number) into one document."""
+    lines = ["War Game Directive", ""]
+    for part in range(1, len(PART_TITLES) + 1):
+        text = parts.get(part, parts.get(str(part)))
+        if text is None:
+            continue
+        lines.append(f"{part}. {PART_TITLES[part]}")
+        lines.append(text.strip())
+        lines.append("")
+    return "\n".join(lines).rstrip() + "\n"
+
+def retrieve_parts(session: Dict[str, Any], query: str, top_k: int = CHAT_RETRIEVAL_TOP_K) -> List[Tuple[int, str]]:
+    """Returns up to top_k (part, deliverable) pairs ranked by BM25 against query."""
+    parts = session.get("directive_parts") or {}
+    index = session.get("directive_index") or {}
+    if not parts or top_k <= 0:
+        return []
+
+    docs = {key: entry for key, entry in index.items() if key in parts}
+    n_docs = len(docs)
+    avg_len = (sum(entry["len"] for entry in docs.values()) / n_docs) if n_docs else 0.0
+    query_terms = set(tokenize(query))
+
+    scores = []
+    for key, entry in docs.items():
+        tf = entry["tf"]
+        doc_len = entry["len"]
+        score = 0.0
+        for term in query_terms:
+            freq = tf.get(term, 0)
+            if not freq:
+                continue
+            df = sum(1 for other in docs.values() if term in other["tf"])
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            norm = _K1 * (1 - _B + _B * doc_len / avg_len) if avg_len else _K1
+            score += idf * freq * (_K1 + 1) / (freq + norm)
+        if score > 0:
+            scores.append((score, int(key)))
+
+    if scores:
+        scores.sort(key=lambda item: (-item[0], item[1]))
+        chosen = [part for _, part in scores[:top_k]]
+    else:
+        chosen = [part for part in DEFAULT_PARTS if str(part) in parts][:top_k]
+    return [(part, parts[str(part)]) for part in chosen]
+
+# --- Revisions: which parts does a change to the case facts affect? ---
+# Parts that restate the whole case are regenerated on every revision
+REVISION_ALWAYS_PARTS = tuple(int(p) for p in os.getenv("REVISION_ALWAYS_PARTS", "1,10").split(",") if p.strip())
+REVISION_TOP_K = int(os.getenv("REVISION_TOP_K", "3"))
+# Above this share of changed sentences the facts are treated as a new case
+REVISION_FULL_THRESHOLD = float(os.getenv("REVISION_FULL_THRESHOLD", "0.5"))
+
+# Terms that tie a fact to a part even when its current deliverable doesn't use them
+PART_KEYWORDS = {
+    2: "act section law statute court forum jurisdiction commission tribunal clause contract agreement breach",
+    3: "evidence document documents receipt invoice bill warranty email emails letter witness witnesses photo photos record records proof",
+    4: "opposing opponent retailer seller manufacturer company defendant respondent landlord employer builder denied refused",
+    6: "amount price cost costs paid payment refund compensation damages interest loss losses fee fees rs rupees ₹ lakh lakhs crore money",
+    7: "scenario settlement appeal outcome risk",
+    8: "negotiation offer settlement mediation leverage",
+    9: "date dates deadline days months weeks notice limitation filed filing timeline hearing",
+}
+_PART_KEYWORD_SETS = {part: set(terms.split()) for part, terms in PART_KEYWORDS.items()}
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def _sentences(text: str) -> List[str]:
+    return [" ".join(s.lower().split()) for s in _SENTENCE_RE.split(text or "") if s.strip()]
+
+def changed_fact_text(old_facts: str, new_facts: str) -> Tuple[str, float]:
+    """Sentences added or removed between two versions of the facts, and the share of sentences that changed."""
+    old, new = _sentences(old_facts), _sentences(new_facts)
+    old_set, new_set = set(old), set(new)
+    added = [s for s in new if s not in old_set]
+    removed = [s for s in old if s not in new_set]
+    # an edited sentence shows up once as removed and once as added; count it once
+    ratio = min(max(len(set(added)), len(set(removed))) / max(len(old_set), 1), 1.0)
+    return " ".join(added + removed), ratio
+
+def affected_parts(session: Dict[str, Any], old_facts: str, new_facts: str) -> List[int]:
+    """
+    Parts to regenerate after the facts changed: those whose keywords or stored
+    deliverables (BM25, as for chat retrieval) match the changed sentences,
+    plus REVISION_ALWAYS_PARTS. Returns every part when most of the facts
+    changed and none when nothing did.
+    """
+    changed, ratio = changed_fact_text(old_facts, new_facts)
+    if not changed:
+        return []
+    if ratio > REVISION_FULL_THRESHOLD or not session.get("directive_parts"):
+        return list(PART_TITLES)
+    terms = set(tokenize(changed))
+    parts = set(REVISION_ALWAYS_PARTS)
+    parts.update(part for part, keywords in _PART_KEYWORD_SETS.items() if terms & keywords)
+    parts.update(part for part, _ in retrieve_parts(session, changed, REVISION_TOP_K))
+    return sorted(p for p in parts if p in PART_TITLES)
@@ -1,50 +1,192 @@
 # execute_tools.py
+import os
 import json
-from typing import List, AsyncGenerator
+import hashlib
+from typing import Any, Dict, List, AsyncGenerator, Optional
 from dotenv import load_dotenv
 load_dotenv()
 
-# We use TavilySearch if available; otherwise fallback to a stub.
-try:
-    from langchain_tavily import TavilySearch
-    HAVE_TAVILY = True
-except Exception:
-    HAVE_TAVILY = False
-
-if HAVE_TAVILY:
-    tavily = TavilySearch(
-        topic="news",
-        search_depth="advanced",
-        include_answer="advanced",
-        include_raw_content="text",
-        country="india",
-        include_domains=["https://indiankanoon.org/", "https://www.indiacode.nic.in/"]
-    )
-else:
-    tavily = None
+from metrics import SEARCH_QUERIES, span
+from resilience import get_policy
+from ttl_cache import MISSING, TieredCache
 
 import asyncio
+import threading
 
-async def run_search_queries(queries: List[str]) -> AsyncGenerator[tuple, None]:
+# Search configuration; also part of the cache key so changing it invalidates cached results
+TAVILY_CONFIG = dict(
+    topic="news",
+    search_depth="advanced",
+    include_answer="advanced",
+    include_raw_content="text",
+    country="india",
+    include_domains=["https://indiankanoon.org/", "https://www.indiacode.nic.in/"]
+)
+
+# The Tavily client (and langchain_tavily itself) is only loaded on first use,
+# so importing this module stays cheap; without langchain_tavily the stub is used.
+_UNSET = object()
+_TAVILY: Any = _UNSET
+_TAVILY_LOCK = threading.Lock()
+
+def get_tavily() -> Any:
+    """The shared TavilySearch client, built on first call, or None to use the stub results."""
+    global _TAVILY
+    if _TAVILY is _UNSET:
+        with _TAVILY_LOCK:
+            if _TAVILY is _UNSET:
+                try:
+                    from langchain_tavily import TavilySearch
+                    _TAVILY = TavilySearch(**TAVILY_CONFIG)
+                except Exception:
+                    _TAVILY = None
+    return _TAVILY
+
+def set_tavily(client: Any):
+    """Overrides the search client (None forces the stub), e.g. with a fake for benchmarks."""
+    global _TAVILY
+    _TAVILY = client
+
+# SEARCH_CONCURRENCY caps Tavily calls in flight across the whole process;
+# SEARCH_TIMEOUT_SECONDS bounds each individual query.
+SEARCH_CONCURRENCY = max(1, int(os.getenv("SEARCH_CONCURRENCY", "6")))
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "20"))
+_SEARCH_SEMAPHORE = asyncio.Semaphore(SEARCH_CONCURRENCY)
+# Retries and circuit breaker for Tavily (SEARCH_* settings, see resilience.py).
+# Rate limiting is off by default: one directive fans out up to 33 queries at
+# once and SEARCH_CONCURRENCY already bounds them; set SEARCH_RATE_PER_SECOND
+# (and a SEARCH_RATE_BURST that fits a directive) to match the plan's quota.
+SEARCH_POLICY = get_policy("SEARCH", os.getenv("TAVILY_API_KEY"))
+
+# Search-result cache: memory LRU plus an optional SQLite file (SEARCH_CACHE_PATH)
+# that survives restarts and can be shared by workers on the same host.
+SEARCH_CACHE = TieredCache(
+    max_entries=int(os.getenv("SEARCH_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+    disk_path=os.getenv("SEARCH_CACHE_PATH") or None,
+    disk_max_entries=int(os.getenv("SEARCH_CACHE_DISK_SIZE", "100000")),
+    table="search_cache",
+)
+_CONFIG_DIGEST = hashlib.sha256(json.dumps(TAVILY_CONFIG, sort_keys=True).encode()).hexdigest()[:16]
+
+def normalize_query(query: str) -> str:
+    """Key used to merge duplicate queries: case and whitespace are ignored."""
+    return " ".join(query.lower().split())
+
+def search_cache_key(query: str) -> str:
+    return f"{_CONFIG_DIGEST}:{normalize_query(query)}"
+
+def search_cache_stats() -> Dict[str, Any]:
+    return SEARCH_CACHE.stats()
+
+# Tool payloads are trimmed to the fields clients use instead of being cut at a byte count
+TOOL_RESULT_MAX_ITEMS = int(os.getenv("TOOL_RESULT_MAX_ITEMS", "5"))
+TOOL_SNIPPET_CHARS = int(os.getenv("TOOL_SNIPPET_CHARS", "300"))
+
+def _snippet(text: Any, limit: int = TOOL_SNIPPET_CHARS) -> str:
+    flat = " ".join(str(text or "").split())
+    if len(flat) <= limit:
+        return flat
+    cut = flat[:limit].rsplit(" ", 1)[0]
+    return cut + "…"
+
+def compact_results(res: Any) -> Dict[str, Any]:
     """
-    For each query in queries, yields (query, text_result)
-    This is async so calling code can stream results as they arrive.
+    Reduces a Tavily response to {"answer"?, "results": [{title, url, snippet}]}.
+    Error responses become {"error": message}.
     """
-    for q in queries:
+    if isinstance(res, str):
         try:
-            if tavily is not None:
-                # tavily.invoke is synchronous; run in threadpool to avoid blocking
-                loop = asyncio.get_event_loop()
-                res = await loop.run_in_executor(None, lambda: tavily.invoke(q))
-                # res may be complex; stringify safely
-                try:
-                    result_text = json.dumps(res)[:4000]  # truncate to avoid huge payloads
-                except Exception:
-                    result_text = str(res)[:4000]
-            else:
+            res = json.loads(res)
+        except Exception:
+            return {"results": [{"title": "", "url": "", "snippet": _snippet(res)}]}
+    answer = None
+    items = res
+    if isinstance(res, dict):
+        if res.get("error"):
+            return {"error": str(res["error"])}
+        answer = res.get("answer")
+        items = res.get("results") or []
+    compact = {"results": []}
+    if answer:
+        compact["answer"] = _snippet(answer, TOOL_SNIPPET_CHARS * 2)
+    if isinstance(items, list):
+        for item in items[:TOOL_RESULT_MAX_ITEMS]:
+            if not isinstance(item, dict):
+                continue
+            compact["results"].append({
+                "title": _snippet(item.get("title"), 200),
+                "url": str(item.get("url") or ""),
+                "snippet": _snippet(item.get("content") or item.get("snippet") or ""),
+            })
+    return compact
+
+async def _search_one(query: str) -> Dict[str, Any]:
+    """Runs a single query (or serves it from SEARCH_CACHE) and returns its compact result; never raises."""
+    tavily = get_tavily()
+    if tavily is not None:
+        cache_key = search_cache_key(query)
+        cached = SEARCH_CACHE.get(cache_key)
+        if cached is not MISSING:
+            SEARCH_QUERIES.inc(outcome="cache_hit")
+            return compact_results(cached)
+    outcome = "error"
+    try:
+        async with _SEARCH_SEMAPHORE:
+            with span("search_query"):
+                if tavily is not None:
+                    # tavily.invoke is synchronous; run in threadpool to avoid blocking
+                    # SEARCH_TIMEOUT_SECONDS bounds the whole query, retries included
+                    loop = asyncio.get_running_loop()
+                    res = await asyncio.wait_for(
+                        SEARCH_POLICY.call(lambda: loop.run_in_executor(None, tavily.invoke, query)),
+                        timeout=SEARCH_TIMEOUT_SECONDS,
+                    )
+                    result = compact_results(res)
+                    if "error" not in result:
+                        SEARCH_CACHE.set(cache_key, res)
+                        outcome = "ok"
+                    return result
                 # stub result for local testing
-                result_text = f"(tavily stub) Results for query: {q}"
-        except Exception as e:
-            result_text = f"(search error) {e}"
-        yield q, result_text
-        await asyncio.sleep(0.01)
+                outcome = "stub"
+                return {"results": [{"title": f"(tavily stub) Results for query: {query}", "url": "", "snippet": ""}]}
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        # not retried, but a hung provider should still open the circuit
+        SEARCH_POLICY.breaker.record_failure()
+        return {"error": f"timed out after {SEARCH_TIMEOUT_SECONDS:g}s"}
+    except Exception as e:
+        return {"error": str(e)}
+    finally:
+        SEARCH_QUERIES.inc(outcome=outcome)
+
+async def run_search_queries(queries: List[str], shared: Optional[Dict[str, asyncio.Task]] = None) -> AsyncGenerator[tuple, None]:
+    """
+    Runs all queries concurrently and yields (query, result) as each one completes,
+    where result is the compact dict from compact_results() (or {"error": ...}).
+    `shared` maps normalized query -> search task; pass the same dict for every
+    part of a directive so a query repeated across parts is only sent once.
+    Duplicates within `queries` are yielded once.
+    """
+    tasks = shared if shared is not None else {}
+    waiting: Dict[asyncio.Task, str] = {}
+    for q in queries:
+        key = normalize_query(q)
+        if not key:
+            continue
+        task = tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(_search_one(q))
+            tasks[key] = task
+        if task not in waiting:
+            waiting[task] = q
+
+    pending = set(waiting)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            try:
+                result = task.result()
+            except asyncio.CancelledError:
+                result = {"error": "cancelled"}
+            yield waiting[task], result
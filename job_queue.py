@@ -0,0 +1,107 @@
+# job_queue.py
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import shortuuid
+
+from ttl_cache import MISSING, TTLCache
+
+# Throughput is controlled by the number of workers; JOB_QUEUE_SIZE bounds how
+# many submitted jobs may wait, beyond which submissions are rejected.
+JOB_WORKERS = max(1, int(os.getenv("JOB_WORKERS", "2")))
+JOB_QUEUE_SIZE = max(1, int(os.getenv("JOB_QUEUE_SIZE", "100")))
+JOB_TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "3600"))
+JOB_MAX_RECORDS = int(os.getenv("JOB_MAX_RECORDS", "2000"))
+
+class QueueFullError(Exception):
+    """Raised by submit() when the job queue is at capacity."""
+
+class DirectiveJobQueue:
+    """
+    Bounded queue of background directive jobs served by a fixed worker pool.
+
+    Job records are plain dicts kept in a TTLCache (in-process, like the memory
+    session backend) so they can be polled after completion until they expire:
+      job_id, conversation_id, status (queued|running|completed|failed),
+      created_at, started_at, finished_at, parts {part: deliverable}, error
+    The runner is awaited with the job record and fills in job["parts"].
+    """
+
+    def __init__(self, runner: Callable[[Dict[str, Any]], Awaitable[None]],
+                 workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE):
+        self.runner = runner
+        self.workers = workers
+        self.max_queue = max_queue
+        self.jobs = TTLCache(max_entries=JOB_MAX_RECORDS, ttl=JOB_TTL_SECONDS)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.running = 0
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, payload: Dict[str, Any], conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running")
+        job = {
+            "job_id": shortuuid.uuid(),
+            "conversation_id": conversation_id or shortuuid.uuid(),
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "parts": {},
+            "error": None,
+            "payload": payload,
+        }
+        try:
+            self._queue.put_nowait(job["job_id"])
+        except asyncio.QueueFull:
+            raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+        self.jobs.set(job["job_id"], job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(job_id)
+        return None if job is MISSING else job
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            job = self.get(job_id)
+            if job is None:
+                # expired or evicted while waiting
+                self._queue.task_done()
+                continue
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            self.running += 1
+            try:
+                await self.runner(job)
+                job["status"] = "completed"
+            except asyncio.CancelledError:
+                job["status"] = "failed"
+                job["error"] = "cancelled"
+                raise
+            except Exception as e:
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                job["finished_at"] = time.time()
+                self.running -= 1
+                self._queue.task_done()
@@ -0,0 +1,104 @@
+# llm_backend.py
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncGenerator, Optional
+
+from resilience import ResiliencePolicy
+
+# Models without native async support are called on this bounded pool instead of
+# the event loop, so a slow generation can't freeze every other open stream.
+LLM_THREADPOOL_SIZE = max(1, int(os.getenv("LLM_THREADPOOL_SIZE", "8")))
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=LLM_THREADPOOL_SIZE, thread_name_prefix="llm")
+    return _EXECUTOR
+
+def message_text(resp: Any) -> str:
+    """Extracts plain text from a LangChain message/chunk, LLMResult or raw string."""
+    if resp is None:
+        return ""
+    if isinstance(resp, str):
+        return resp
+    content = getattr(resp, "content", None)
+    if content is not None:
+        # Gemini may return a list of content blocks instead of a plain string
+        if isinstance(content, list):
+            pieces = []
+            for block in content:
+                if isinstance(block, dict):
+                    pieces.append(str(block.get("text", "")))
+                else:
+                    pieces.append(str(block))
+            return "".join(pieces)
+        return str(content)
+    gens = getattr(resp, "generations", None)
+    if gens and len(gens) > 0:
+        cand = gens[0][0]
+        return getattr(cand, "text", str(cand))
+    return str(resp)
+
+class AsyncLLMBackend:
+    """
+    Async facade over a LangChain chat model (or anything with invoke/generate/__call__).
+    Uses the model's native ainvoke/astream when available and falls back to the
+    bounded thread pool otherwise. With a `policy` (see resilience.py) every call
+    is rate limited, deadline-bound, retried and circuit-broken; streams are only
+    retried (and timed) up to their first chunk.
+    """
+
+    def __init__(self, model: Any, policy: Optional[ResiliencePolicy] = None):
+        self.model = model
+        self.policy = policy
+
+    def _invoke_sync(self, prompt: Any) -> Any:
+        model = self.model
+        # prefer .invoke or .generate depending on package
+        if hasattr(model, "invoke"):
+            return model.invoke(prompt)
+        if hasattr(model, "generate"):
+            return model.generate([{"role": "user", "content": prompt}])
+        # fallback call
+        return model(prompt)
+
+    async def ainvoke(self, prompt: Any, **kwargs) -> str:
+        """kwargs (e.g. cached_content) are passed to the model's native async call."""
+        if self.policy is not None:
+            return await self.policy.call(lambda: self._ainvoke(prompt, **kwargs))
+        return await self._ainvoke(prompt, **kwargs)
+
+    async def _ainvoke(self, prompt: Any, **kwargs) -> str:
+        if hasattr(self.model, "ainvoke"):
+            resp = await self.model.ainvoke(prompt, **kwargs)
+        else:
+            loop = asyncio.get_running_loop()
+            resp = await loop.run_in_executor(_get_executor(), self._invoke_sync, prompt)
+        return message_text(resp)
+
+    async def astream(self, prompt: Any, **kwargs) -> AsyncGenerator[str, None]:
+        """Yields text chunks as the provider produces them (one chunk if it can't stream)."""
+        if self.policy is not None:
+            stream = self.policy.stream(lambda: self._astream(prompt, **kwargs))
+        else:
+            stream = self._astream(prompt, **kwargs)
+        try:
+            async for text in stream:
+                yield text
+        finally:
+            # close the provider stream now if our consumer stopped early
+            await stream.aclose()
+
+    async def _astream(self, prompt: Any, **kwargs) -> AsyncGenerator[str, None]:
+        if hasattr(self.model, "astream"):
+            async for chunk in self.model.astream(prompt, **kwargs):
+                text = message_text(chunk)
+                if text:
+                    yield text
+        else:
+            text = await self._ainvoke(prompt, **kwargs)
+            if text:
+                yield text
@@ -2,19 +2,93 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
-from fastapi.responses import StreamingResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, HTMLResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 import asyncio
 import shortuuid
 
-from chat_logic import stream_chat_response
-from reflexion_graph_stream import stream_reflexion_graph
+from chains import get_directive_backend
+from chat_logic import get_chat_backend, stream_chat_response
+from directive_cache import cached_directive_events, cached_directive_stream, directive_cache_stats
+from directive_index import PART_TITLES, affected_parts, assemble_directive, index_part
+from execute_tools import get_tavily, search_cache_stats
+from job_queue import DirectiveJobQueue, QueueFullError
+from metrics import Gauge, instrument_stream, render_metrics, span, start_trace
+from model_registry import close_registry, get_registry
+from resilience import resilience_stats
+from session_store import create_session_store
+from sse import coalesce, encode_event, encode_events, event_size, format_sse
+from stream_buffer import StreamBuffer
+from ttl_cache import MISSING, TTLCache
 
-# --- Ephemeral in-memory store for conversation context ---
-SESSION_STORE = {}
+# --- Bounded store for conversation context (see session_store.py for settings) ---
+SESSION_STORE = create_session_store()
 
-app = FastAPI(title="Legal Advisor API")
+# --- Buffered directive streams, kept so dropped clients can resume ---
+# Generation runs in a background task that writes into a per-conversation
+# buffer; HTTP responses only read from it, using the buffer index as SSE id.
+# Entries are (stream_format, buffer), keyed by conversation_id for the original
+# generation and by "<conversation_id>:<revision_id>" for each revision.
+DIRECTIVE_STREAMS = TTLCache(
+    max_entries=int(os.getenv("DIRECTIVE_STREAM_BUFFERS", "256")),
+    ttl=float(os.getenv("DIRECTIVE_STREAM_TTL_SECONDS", "900")),
+)
+_BACKGROUND_TASKS = set()
+# conversation_ids whose directive is being generated or revised right now
+_GENERATING = set()
+
+# "text": marker-line protocol in SSE frames (default, backwards compatible)
+# "json": SSE frames whose data is NDJSON event lines (see chains.render_text_event for the schema)
+# "ndjson": the same event lines as a plain application/x-ndjson body
+STREAM_FORMATS = ("text", "json", "ndjson")
+
+# Startup warmup. Clients are otherwise built on first use, keeping cold start short:
+#   "0"    nothing is built at startup (default)
+#   "1"    build the model and Tavily clients (imports LangChain) before serving
+#   "ping" also send one tiny chat request so connections are already open
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0").lower()
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "15"))
+
+async def warmup(mode: str = WARMUP_ON_STARTUP) -> dict:
+    """Pre-builds clients (and optionally opens connections); returns seconds spent per step."""
+    timings = {}
+    if mode in ("", "0", "false", "no"):
+        return timings
+    loop = asyncio.get_running_loop()
+
+    start = time.perf_counter()
+    # client construction imports the provider SDKs; keep that off the event loop
+    await loop.run_in_executor(None, lambda: (get_directive_backend(), get_chat_backend(), get_tavily()))
+    timings["clients"] = round(time.perf_counter() - start, 3)
+
+    if mode == "ping":
+        backend = get_chat_backend()
+        if backend is not None:
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(backend.ainvoke("Reply with OK."), timeout=WARMUP_TIMEOUT_SECONDS)
+            except Exception as e:
+                # a failed warmup must not keep the worker from starting
+                timings["ping_error"] = str(e)
+            timings["ping"] = round(time.perf_counter() - start, 3)
+    return timings
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # An already-initialized registry (e.g. fake models from benchmarks/) is kept
+    get_registry()
+    app.state.warmup = await warmup()
+    JOB_QUEUE.start()
+    yield
+    await JOB_QUEUE.stop()
+    close_registry()
+
+app = FastAPI(title="Legal Advisor API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +104,11 @@ async def root():
         """
         <h3>Legal Advisor API</h3>
         <p><b>1. Generate Directive:</b> POST to <code>/generate_directive</code> with JSON <code>{"case_facts":"..."}</code> to start.</p>
+        <p>Add <code>"stream_format": "json"</code> (SSE) or <code>"ndjson"</code> to receive typed JSON events instead of marker text.</p>
+        <p><b>Resume:</b> GET <code>/generate_directive/{conversation_id}/stream</code> with a <code>Last-Event-ID</code> header to continue a dropped directive stream.</p>
+        <p><b>Background job:</b> POST <code>/jobs/directive</code> with the same body, then poll <code>/jobs/{job_id}</code>, <code>/jobs/{job_id}/parts</code> and <code>/jobs/{job_id}/result</code>.</p>
+        <p>Add <code>"trace": true</code> to get a per-stage timing summary at the end of the stream; Prometheus metrics are served at <code>/metrics</code>.</p>
+        <p><b>Revise:</b> POST to <code>/revise_directive</code> with JSON <code>{"conversation_id":"...", "case_facts":"..."}</code> (or <code>"parts": [6]</code>) to regenerate only the affected parts; GET <code>/directive/{conversation_id}</code> returns the current directive.</p>
         <p><b>2. Chat:</b> POST to <code>/chat</code> with JSON <code>{"query":"...", "conversation_id": "..."}</code> to have a conversation.</p>
         """
     )
@@ -45,21 +124,326 @@ async def generate_directive(request: Request, background_tasks: BackgroundTasks
     if not case_facts:
         raise HTTPException(status_code=400, detail="Missing 'case_facts' in request body")
 
+    received = time.perf_counter()
+    stream_format = body.get("stream_format") or "text"
+    if stream_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"'stream_format' must be one of {', '.join(STREAM_FORMATS)}")
+
     new_conversation_id = shortuuid.uuid()
-    SESSION_STORE[new_conversation_id] = {"case_facts": case_facts, "history": []}
+    SESSION_STORE.create(new_conversation_id, {"case_facts": case_facts, "history": []})
+
+    buffer = start_directive(new_conversation_id, case_facts, stream_format, trace=bool(body.get("trace")))
+    return stream_response(stream_format, buffer, received=received)
+
+
+def _stream_key(conversation_id: str, revision_id: Optional[str] = None) -> str:
+    return f"{conversation_id}:{revision_id}" if revision_id else conversation_id
+
+
+def start_directive(conversation_id: str, case_facts: str, stream_format: str, trace: bool = False,
+                    parts: Optional[List[int]] = None, revision: Optional[dict] = None) -> StreamBuffer:
+    """Starts (re)generating a directive in the background and returns the buffer clients read from."""
+    buffer = StreamBuffer()
+    revision_id = revision["revision_id"] if revision is not None else None
+    DIRECTIVE_STREAMS.set(_stream_key(conversation_id, revision_id), (stream_format, buffer))
+    store_deliverable = deliverable_saver(conversation_id, case_facts)
+    runner = run_directive if stream_format == "text" else run_directive_events
+
+    async def run():
+        # cleared in the same step that closes the buffer, so a client that
+        # has read the whole stream can revise straight away
+        try:
+            await runner(buffer, conversation_id, case_facts, store_deliverable,
+                         trace=trace, parts=parts, revision=revision)
+        finally:
+            _GENERATING.discard(conversation_id)
+
+    _GENERATING.add(conversation_id)
+    task = asyncio.create_task(run())
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return buffer
+
+
+def _part_list(parts: List[int]) -> str:
+    return ", ".join(map(str, parts)) or "none"
+
+
+def deliverable_saver(conversation_id: str, case_facts: str):
+    """on_deliverable callback that keeps each finished part (and its search index) so /chat can retrieve it."""
+    def store_deliverable(part: int, deliverable: str):
+        session = SESSION_STORE.get(conversation_id, {"case_facts": case_facts, "history": []})
+        index_part(session, part, deliverable)
+        SESSION_STORE.save(conversation_id, session)
+    return store_deliverable
+
 
-    async def directive_generator():
+async def run_directive(buffer: StreamBuffer, conversation_id: str, case_facts: str, on_deliverable, trace: bool = False,
+                        parts: Optional[List[int]] = None, revision: Optional[dict] = None):
+    """
+    Generates the directive into `buffer`, independently of any HTTP connection.
+    With `parts`, only those parts are generated (see /revise_directive).
+    """
+    # spans of this generation (and the tasks it starts) are collected for the [TRACE] line
+    request_trace = start_trace() if trace else None
+    try:
         # Send conversation ID first
-        yield f"data: [CONVERSATION_ID] {new_conversation_id}\n\n"
+        buffer.append(f"[CONVERSATION_ID] {conversation_id}")
+        if revision is not None:
+            buffer.append(f"[REVISION] {revision['revision_id']}: regenerating parts: {_part_list(revision['regenerated'])}; "
+                          f"reusing parts: {_part_list(revision['reused'])}")
+
+        # Stream 11 parts, merging token-sized chunks into fewer, larger frames
+        async for frame in coalesce(cached_directive_stream(case_facts, on_deliverable=on_deliverable, parts=parts)):
+            buffer.append(frame)
+
+        buffer.append("[INFO] Directive generation complete.")
+        if request_trace is not None:
+            buffer.append(f"[TRACE] {json.dumps(request_trace.summary())}")
+        buffer.close()
+    except asyncio.CancelledError as e:
+        buffer.close(e)
+        raise
+    except Exception as e:
+        buffer.append(f"[ERROR] {e}\n")
+        buffer.close(e)
+
+
+async def run_directive_events(buffer: StreamBuffer, conversation_id: str, case_facts: str, on_deliverable, trace: bool = False,
+                               parts: Optional[List[int]] = None, revision: Optional[dict] = None):
+    """Structured counterpart of run_directive: each buffer entry is a batch of NDJSON event lines."""
+    request_trace = start_trace() if trace else None
+    try:
+        buffer.append(encode_event({"type": "conversation", "conversation_id": conversation_id}))
+        if revision is not None:
+            buffer.append(encode_event(dict(revision, type="revision")))
+        async for batch in coalesce(cached_directive_events(case_facts, on_deliverable=on_deliverable, parts=parts),
+                                    join=encode_events, measure=event_size):
+            buffer.append(batch)
+        if request_trace is not None:
+            buffer.append(encode_event(dict(request_trace.summary(), type="trace")))
+        buffer.close()
+    except asyncio.CancelledError as e:
+        buffer.close(e)
+        raise
+    except Exception as e:
+        buffer.append(encode_event({"type": "error", "message": str(e)}))
+        buffer.close(e)
+
+
+async def buffered_sse(buffer: StreamBuffer, start: int = 0, trim_newline: bool = False):
+    """SSE view of a directive buffer; each event's id is its buffer index."""
+    async for index, chunk in buffer.subscribe(start):
+        if trim_newline:
+            # NDJSON batches end in a newline; the frame's own terminator already separates them
+            chunk = chunk[:-1] if chunk.endswith("\n") else chunk
+        with span("sse_emit"):
+            frame = format_sse(chunk, event_id=index)
+        yield frame
+
+
+async def buffered_ndjson(buffer: StreamBuffer):
+    async for _, batch in buffer.subscribe():
+        yield batch
+
+
+def stream_response(stream_format: str, buffer: StreamBuffer, start: int = 0,
+                    received: Optional[float] = None) -> StreamingResponse:
+    """`received` is set for the original request only, so resumed streams don't skew TTFB."""
+    if stream_format == "ndjson":
+        body = instrument_stream("generate_directive", buffered_ndjson(buffer), received, stream_format)
+        return StreamingResponse(body, media_type="application/x-ndjson")
+    frames = buffered_sse(buffer, start, trim_newline=stream_format == "json")
+    return StreamingResponse(instrument_stream("generate_directive", frames, received, stream_format),
+                             media_type="text/event-stream")
+
+
+@app.get("/generate_directive/{conversation_id}/stream")
+async def resume_directive(conversation_id: str, request: Request, last_event_id: Optional[int] = None,
+                           revision_id: Optional[str] = None):
+    """
+    Resumes a directive stream after a dropped connection. Send the id of the
+    last event received in the Last-Event-ID header (browsers' EventSource does
+    this automatically) or as ?last_event_id=; replay starts right after it.
+    Without either, the whole stream is replayed from the beginning. NDJSON
+    streams carry no ids and are always replayed from the beginning.
+    A /revise_directive stream is resumed with its ?revision_id=.
+    """
+    entry = DIRECTIVE_STREAMS.get(_stream_key(conversation_id, revision_id))
+    if entry is MISSING:
+        raise HTTPException(status_code=404, detail="No buffered directive stream for this conversation_id")
+    stream_format, buffer = entry
+
+    header = request.headers.get("last-event-id")
+    if last_event_id is None and header:
+        try:
+            last_event_id = int(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID header")
+    start = 0 if last_event_id is None else last_event_id + 1
+
+    return stream_response(stream_format, buffer, start)
+
+
+@app.post("/revise_directive")
+async def revise_directive(request: Request):
+    """
+    Regenerates part of an existing directive. Send the conversation_id with
+    either the updated case_facts (the affected parts are worked out from the
+    changed sentences) or an explicit "parts" list; both may be given. Only
+    those parts are streamed; the other stored deliverables are kept as they are.
+    Answers 409 while the conversation's directive is still being generated.
+    The stream opens with the revision's id, used to resume it.
+    """
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+
+    received = time.perf_counter()
+    conversation_id = body.get("conversation_id")
+    new_facts = body.get("case_facts")
+    requested = body.get("parts")
+    if not conversation_id or (not new_facts and requested is None):
+        raise HTTPException(status_code=400, detail="Send 'conversation_id' and 'case_facts' and/or 'parts'")
+    if new_facts is not None and not isinstance(new_facts, str):
+        raise HTTPException(status_code=400, detail="'case_facts' must be a string")
+    stream_format = body.get("stream_format") or "text"
+    if stream_format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"'stream_format' must be one of {', '.join(STREAM_FORMATS)}")
+
+    session = SESSION_STORE.get(conversation_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation_id")
+    if not session.get("directive_parts"):
+        raise HTTPException(status_code=409, detail="No directive has been generated for this conversation yet")
+    # a running generation would keep saving parts built from the old facts
+    if conversation_id in _GENERATING:
+        raise HTTPException(status_code=409, detail="The directive for this conversation is still being generated")
+
+    old_facts = session.get("case_facts", "")
+    case_facts = new_facts or old_facts
+    parts = set()
+    if requested is not None:
+        if not isinstance(requested, list) or not all(type(p) is int and p in PART_TITLES for p in requested):
+            raise HTTPException(status_code=400, detail=f"'parts' must be a list of part numbers 1-{len(PART_TITLES)}")
+        parts.update(requested)
+    if new_facts and new_facts != old_facts:
+        parts.update(affected_parts(session, old_facts, new_facts))
+        session["case_facts"] = new_facts
+        SESSION_STORE.save(conversation_id, session)
 
-        # Stream 11 parts separately
-        async for chunk in stream_reflexion_graph(case_facts):
-            yield f"data: {chunk}\n\n"
-            await asyncio.sleep(0.001)
+    parts = sorted(parts)
+    revision = {
+        "revision_id": shortuuid.uuid(),
+        "regenerated": parts,
+        "reused": [p for p in PART_TITLES if p not in parts and str(p) in session["directive_parts"]],
+    }
+    buffer = start_directive(conversation_id, case_facts, stream_format, trace=bool(body.get("trace")),
+                             parts=parts, revision=revision)
+    return stream_response(stream_format, buffer, received=received)
 
-        yield f"data: [INFO] Directive generation complete.\n\n"
 
-    return StreamingResponse(directive_generator(), media_type="text/event-stream")
+@app.get("/directive/{conversation_id}")
+async def get_directive(conversation_id: str):
+    """The conversation's current directive, as generated and revised so far."""
+    session = SESSION_STORE.get(conversation_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation_id")
+    parts = session.get("directive_parts") or {}
+    return {
+        "conversation_id": conversation_id,
+        "case_facts": session.get("case_facts", ""),
+        "parts": parts,
+        "directive": assemble_directive(parts) if parts else "",
+    }
+
+
+async def run_directive_job(job: dict):
+    """Job-queue runner: generates the directive without any client attached."""
+    conversation_id = job["conversation_id"]
+    case_facts = job["payload"]["case_facts"]
+    save = deliverable_saver(conversation_id, case_facts)
+
+    def on_deliverable(part: int, deliverable: str):
+        job["parts"][part] = deliverable
+        save(part, deliverable)
+
+    _GENERATING.add(conversation_id)
+    try:
+        async for _ in cached_directive_events(case_facts, on_deliverable=on_deliverable):
+            pass
+    finally:
+        _GENERATING.discard(conversation_id)
+    if len(job["parts"]) < len(PART_TITLES):
+        raise RuntimeError(f"only {len(job['parts'])} of {len(PART_TITLES)} parts were generated")
+
+
+# --- Background jobs for clients that don't want to hold a stream open ---
+JOB_QUEUE = DirectiveJobQueue(run_directive_job)
+
+
+def job_summary(job: dict) -> dict:
+    return {
+        "job_id": job["job_id"],
+        "conversation_id": job["conversation_id"],
+        "status": job["status"],
+        "parts_completed": len(job["parts"]),
+        "total_parts": len(PART_TITLES),
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+    }
+
+
+def get_job_or_404(job_id: str) -> dict:
+    job = JOB_QUEUE.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job_id")
+    return job
+
+
+@app.post("/jobs/directive", status_code=202)
+async def submit_directive_job(request: Request):
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+
+    case_facts = body.get("case_facts")
+    if not case_facts:
+        raise HTTPException(status_code=400, detail="Missing 'case_facts' in request body")
+
+    conversation_id = shortuuid.uuid()
+    try:
+        job = JOB_QUEUE.submit({"case_facts": case_facts}, conversation_id=conversation_id)
+    except QueueFullError as e:
+        # backpressure: tell the client to come back later instead of queueing without bound
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    SESSION_STORE.create(conversation_id, {"case_facts": case_facts, "history": []})
+    return dict(job_summary(job), queue_depth=JOB_QUEUE.depth)
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return job_summary(get_job_or_404(job_id))
+
+
+@app.get("/jobs/{job_id}/parts")
+async def job_parts(job_id: str):
+    job = get_job_or_404(job_id)
+    parts = {str(part): text for part, text in sorted(job["parts"].items())}
+    return dict(job_summary(job), parts=parts)
+
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(job_id: str):
+    job = get_job_or_404(job_id)
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}; result not available yet")
+    parts = {str(part): text for part, text in sorted(job["parts"].items())}
+    return dict(job_summary(job), parts=parts, directive=assemble_directive(job["parts"]))
 
 
 @app.post("/chat")
@@ -76,10 +460,39 @@ async def chat(request: Request):
 
     async def sse_event_wrapper(generator):
         async for chunk in generator:
-            yield f"data: {chunk}\n\n"
-            await asyncio.sleep(0.001)
+            yield format_sse(chunk)
 
     return StreamingResponse(
-        sse_event_wrapper(stream_chat_response(query, conversation_id, SESSION_STORE)),
+        instrument_stream("chat", sse_event_wrapper(stream_chat_response(query, conversation_id, SESSION_STORE))),
         media_type="text/event-stream"
     )
+
+
+# --- Metrics read from existing stores at scrape time ---
+def _cache_samples():
+    samples = {}
+    for name, stats in (("search", search_cache_stats()), ("directive", directive_cache_stats())):
+        samples[(name, "hits")] = stats["hits"]
+        samples[(name, "misses")] = stats["misses"]
+        samples[(name, "hit_rate")] = stats["hit_rate"]
+    return samples
+
+def _resilience_samples():
+    samples = {}
+    for name, stats in resilience_stats().items():
+        for key in ("calls", "retries", "failures", "rejected", "hedged", "rate"):
+            samples[(name, key)] = stats[key]
+        samples[(name, "circuit_open")] = 1 if stats["state"] == "open" else 0
+    return samples
+
+Gauge("session_store_sessions", "Sessions currently held by the session store.", fn=lambda: {(): len(SESSION_STORE)})
+Gauge("directive_stream_buffers", "Buffered directive streams kept for resume.", fn=lambda: {(): len(DIRECTIVE_STREAMS)})
+Gauge("cache_stat", "Search and directive cache hits, misses and hit rate.", ("cache", "stat"), fn=_cache_samples)
+Gauge("provider_resilience", "Per provider/key call, retry and circuit-breaker counters.", ("policy", "stat"), fn=_resilience_samples)
+Gauge("job_queue", "Directive job queue depth and running jobs.", ("stat",),
+      fn=lambda: {("queued",): JOB_QUEUE.depth, ("running",): JOB_QUEUE.running})
+
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
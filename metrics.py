@@ -0,0 +1,242 @@
+# metrics.py
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Minimal Prometheus text-format metrics (no client library needed) and
+# per-request trace spans. Metrics are process-wide; with several workers each
+# one exposes its own /metrics.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                for key, v in sorted(self._values.items())]
+
+class Gauge(_Metric):
+    """Set/inc/dec gauge; with `fn`, its samples are read from fn() -> {label tuple: value} at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 fn: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.fn = fn
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        values = dict(self._values)
+        if self.fn is not None:
+            try:
+                values.update(self.fn())
+            except Exception:
+                # a broken collector must not take the whole scrape down
+                pass
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+                for key, v in sorted(values.items())]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., sum, count]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def count(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-1] if state else 0.0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, state in sorted(self._values.items()):
+            for bound, n in zip(self.buckets, state):
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(n)}")
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(state[-1])}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """The whole registry in Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# --- Pipeline metrics ---
+STAGE_SECONDS = Histogram("directive_stage_seconds", "Time spent per pipeline stage.", ("stage",))
+PART_SECONDS = Histogram("directive_part_seconds", "Time from a part's first model output until the part was fully produced.", ("part",))
+LLM_TTFT_SECONDS = Histogram("llm_time_to_first_token_seconds", "Time from LLM call start to its first chunk.", ("model",))
+DIRECTIVE_TTFB_SECONDS = Histogram("directive_ttfb_seconds", "Time from request to the first frame sent to the client.", ("format",))
+DIRECTIVE_SECONDS = Histogram("directive_seconds", "Total time to stream a whole directive.", ("format",))
+LLM_TOKENS = Counter("llm_tokens_total", "Estimated LLM tokens (see chat_context.estimate_tokens).", ("model", "direction"))
+LLM_CALLS = Counter("llm_calls_total", "LLM calls by outcome.", ("model", "outcome"))
+SEARCH_QUERIES = Counter("search_queries_total", "Search queries by outcome.", ("outcome",))
+SSE_FRAMES = Counter("sse_frames_total", "Frames written to streaming responses.", ("endpoint",))
+SSE_BYTES = Counter("sse_bytes_total", "Bytes written to streaming responses.", ("endpoint",))
+ACTIVE_STREAMS = Gauge("active_streams", "Streaming responses currently open.", ("endpoint",))
+
+# --- Trace spans ---
+# A Trace collects spans for one request. It lives in a context variable, so
+# tasks created while it is active (parts, searches) record into it too.
+_CURRENT_TRACE: contextvars.ContextVar = contextvars.ContextVar("directive_trace", default=None)
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def add(self, name: str, start: float, duration: float, attrs: Dict[str, Any]):
+        self.spans.append(dict(
+            attrs,
+            name=name,
+            start_ms=round((start - self.started) * 1000, 1),
+            duration_ms=round(duration * 1000, 1),
+        ))
+
+    def summary(self) -> Dict[str, Any]:
+        """Spans in start order plus the total time per span name."""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span["name"]] = round(totals.get(span["name"], 0.0) + span["duration_ms"], 1)
+        spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {"elapsed_ms": round((time.perf_counter() - self.started) * 1000, 1), "totals_ms": totals, "spans": spans}
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _CURRENT_TRACE.set(trace)
+    return trace
+
+def record_span(name: str, start: float, duration: float, **attrs):
+    """Records a finished stage: always into STAGE_SECONDS, and into the current trace if any."""
+    if not METRICS_ENABLED:
+        return
+    STAGE_SECONDS.observe(duration, stage=name)
+    trace = _CURRENT_TRACE.get()
+    if trace is not None:
+        trace.add(name, start, duration, attrs)
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, start, time.perf_counter() - start, **attrs)
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+async def instrument_stream(endpoint: str, frames: AsyncIterator[str], received: Optional[float] = None,
+                            stream_format: str = "text") -> AsyncIterator[str]:
+    """
+    Wraps a streaming response body: counts frames/bytes and open streams and,
+    when `received` (perf_counter at request arrival) is given, observes TTFB
+    and total directive time.
+    """
+    ACTIVE_STREAMS.inc(endpoint=endpoint)
+    first = True
+    try:
+        async for frame in frames:
+            if first and received is not None:
+                DIRECTIVE_TTFB_SECONDS.observe(time.perf_counter() - received, format=stream_format)
+            first = False
+            SSE_FRAMES.inc(endpoint=endpoint)
+            SSE_BYTES.inc(len(frame), endpoint=endpoint)
+            yield frame
+        if received is not None:
+            DIRECTIVE_SECONDS.observe(time.perf_counter() - received, format=stream_format)
+    finally:
+        ACTIVE_STREAMS.dec(endpoint=endpoint)
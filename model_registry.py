@@ -0,0 +1,89 @@
+# model_registry.py
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from llm_backend import AsyncLLMBackend
+from resilience import get_policy
+
+# Deadlines for one LLM attempt: LLM_TIMEOUT_SECONDS for a whole ainvoke()
+# answer, LLM_FIRST_CHUNK_TIMEOUT_SECONDS for the first chunk of astream().
+# A call that hangs then fails (and is retried) instead of holding its
+# semaphore slot forever, and counts towards the circuit breaker.
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_FIRST_CHUNK_TIMEOUT_SECONDS = float(os.getenv("LLM_FIRST_CHUNK_TIMEOUT_SECONDS", "60"))
+
+# (model, temperature, max_output_tokens)
+ModelKey = Tuple[str, float, Optional[int]]
+
+def google_api_key() -> Optional[str]:
+    return os.getenv("GOOGLE_API_KEY") or os.getenv("GOOGLE_GENAI_API_KEY")
+
+def google_model_factory(model: str, temperature: float, max_tokens: Optional[int]) -> Any:
+    """
+    Builds a Gemini chat model, or returns None when langchain_google_genai is
+    not installed (callers then use their stub path).
+    """
+    try:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+    except Exception:
+        return None
+    kwargs = dict(
+        model=model,
+        temperature=temperature,
+        api_key=google_api_key(),
+    )
+    if max_tokens is not None:
+        kwargs["max_output_tokens"] = max_tokens
+    return ChatGoogleGenerativeAI(**kwargs)
+
+class ModelRegistry:
+    """
+    One shared AsyncLLMBackend per (model, temperature, max tokens).
+    Each client is built once and reused by every request, so its HTTP/gRPC
+    connections stay pooled instead of being set up per call. All backends on
+    the same API key share one resilience policy (rate limit, retries, circuit).
+    """
+
+    def __init__(self, factory: Callable[[str, float, Optional[int]], Any] = google_model_factory):
+        self.factory = factory
+        self._backends: Dict[ModelKey, Optional[AsyncLLMBackend]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str, temperature: float = 0.0, max_tokens: Optional[int] = None) -> Optional[AsyncLLMBackend]:
+        key = (model, float(temperature), max_tokens)
+        if key in self._backends:
+            return self._backends[key]
+        with self._lock:
+            if key not in self._backends:
+                client = self.factory(model, float(temperature), max_tokens)
+                policy = get_policy("LLM", google_api_key(), rate_per_second=20, rate_burst=20,
+                                    timeout=LLM_TIMEOUT_SECONDS, first_chunk_timeout=LLM_FIRST_CHUNK_TIMEOUT_SECONDS)
+                self._backends[key] = AsyncLLMBackend(client, policy) if client is not None else None
+            return self._backends[key]
+
+    def close(self):
+        with self._lock:
+            self._backends.clear()
+
+_REGISTRY: Optional[ModelRegistry] = None
+
+def init_registry(factory: Optional[Callable[[str, float, Optional[int]], Any]] = None) -> ModelRegistry:
+    """(Re)creates the process-wide registry, e.g. with a fake factory for benchmarks."""
+    global _REGISTRY
+    if _REGISTRY is not None:
+        _REGISTRY.close()
+    _REGISTRY = ModelRegistry(factory) if factory is not None else ModelRegistry()
+    return _REGISTRY
+
+def get_registry() -> ModelRegistry:
+    """Returns the process-wide registry, creating it with the default factory on first use."""
+    if _REGISTRY is None:
+        return init_registry()
+    return _REGISTRY
+
+def close_registry():
+    global _REGISTRY
+    if _REGISTRY is not None:
+        _REGISTRY.close()
+        _REGISTRY = None
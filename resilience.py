@@ -0,0 +1,356 @@
+# resilience.py
+import os
+import re
+import time
+import random
+import asyncio
+import hashlib
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+# Shared protection for outbound provider calls (Gemini, Tavily). One policy per
+# (provider, API key) combines:
+#   - an adaptive token bucket: <PREFIX>_RATE_PER_SECOND with bursts of
+#     <PREFIX>_RATE_BURST; the rate is halved on every quota error and creeps
+#     back up on success,
+#   - retries with full-jitter exponential backoff for retryable errors
+#     (<PREFIX>_MAX_RETRIES, <PREFIX>_RETRY_BASE_SECONDS, <PREFIX>_RETRY_MAX_SECONDS),
+#   - a circuit breaker that fails fast for <PREFIX>_CIRCUIT_RESET_SECONDS after
+#     <PREFIX>_CIRCUIT_FAILURES consecutive provider failures,
+#   - optional hedging: if no answer (or first streamed chunk) has arrived after
+#     <PREFIX>_HEDGE_AFTER_SECONDS a second identical request is raced against
+#     the first. 0 disables it; hedged calls cost quota,
+#   - optional deadlines, set by the caller: `timeout` bounds each call()
+#     attempt and `first_chunk_timeout` how long stream() waits for its first
+#     chunk. A timed-out attempt counts as a provider failure.
+# PREFIX is LLM or SEARCH.
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open."""
+
+class RateLimitTimeout(Exception):
+    """Raised when a call would wait longer than RATE_LIMIT_MAX_WAIT_SECONDS for a token."""
+
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "30"))
+
+_RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+# Fallbacks for errors that carry no status attribute. Codes must stand alone,
+# so "payload size 15000 bytes" or "max_output_tokens 5000" don't match.
+_RATE_LIMIT_RE = re.compile(r"\b429\b|quota|rate limit|resource[ _]exhausted|too many requests")
+_TRANSIENT_RE = re.compile(
+    r"\b(?:500|502|503|504)\b|unavailable|deadline exceeded|internal error"
+    r"|timed out|timeout|connection reset|connection aborted|temporarily"
+)
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    for attr in ("status_code", "code", "status"):
+        value = getattr(exc, attr, None)
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                value = None
+        value = getattr(value, "value", value)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    if _status_code(exc) == 429:
+        return True
+    return _RATE_LIMIT_RE.search(str(exc).lower()) is not None
+
+def is_retryable(exc: BaseException) -> bool:
+    """Quota, 5xx, timeout and connection errors are worth retrying; bad requests are not."""
+    if isinstance(exc, (CircuitOpenError, RateLimitTimeout)):
+        return False
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = _status_code(exc)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    if is_rate_limit_error(exc):
+        return True
+    return _TRANSIENT_RE.search(str(exc).lower()) is not None
+
+class TokenBucket:
+    """
+    Async token bucket. The refill rate adapts: penalize() halves it (down to
+    min_rate) when the provider reports a quota error, reward() raises it back
+    towards the configured rate a little on each success.
+    """
+
+    def __init__(self, rate: float, burst: float, min_rate: Optional[float] = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate if min_rate is not None else max(rate / 16.0, 0.05)
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, max_wait: float = RATE_LIMIT_MAX_WAIT_SECONDS):
+        if self.max_rate <= 0:
+            return
+        # the lock queues waiters fairly, so a burst drains in arrival order
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                if wait > max_wait:
+                    raise RateLimitTimeout(f"rate limited: next slot in {wait:.1f}s")
+                await asyncio.sleep(wait)
+                self._refill()
+            self.tokens -= 1
+
+    def penalize(self):
+        self.rate = max(self.min_rate, self.rate / 2.0)
+        self.tokens = min(self.tokens, 0.0)
+
+    def reward(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20.0)
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures; one probe call is let through after `reset_timeout`."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._probe_started = 0.0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "closed" or self.failure_threshold <= 0:
+            return
+        # a probe that never reported back (e.g. hung without a deadline) must
+        # not keep the circuit open for good
+        if state == "half_open" and (not self._probing or time.monotonic() - self._probe_started >= self.reset_timeout):
+            self._probing = True
+            self._probe_started = time.monotonic()
+            return
+        retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(f"{self.name} circuit open after {self.failures} failures; retry in {retry_in:.0f}s")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release_probe(self):
+        """Lets the next call probe again when the probe ended without a verdict."""
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.failure_threshold > 0 and (self.opened_at is not None or self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+
+class ResiliencePolicy:
+    """Rate limit + retry + circuit breaker + hedging around one provider/key."""
+
+    def __init__(self, name: str, rate: float = 0.0, burst: float = 1.0, max_retries: int = 2,
+                 retry_base: float = 0.5, retry_max: float = 8.0, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0, hedge_after: float = 0.0, timeout: float = 0.0,
+                 first_chunk_timeout: float = 0.0):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.max_retries = max(0, max_retries)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.hedge_after = hedge_after
+        self.timeout = timeout
+        self.first_chunk_timeout = first_chunk_timeout
+        self.stats_counts = {"calls": 0, "retries": 0, "failures": 0, "rejected": 0, "hedged": 0}
+
+    def backoff(self, attempt: int) -> float:
+        # "full jitter": spreads retries from many callers instead of synchronizing them
+        return random.uniform(0, min(self.retry_max, self.retry_base * (2 ** attempt)))
+
+    async def _admit(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.stats_counts["rejected"] += 1
+            raise
+        await self.bucket.acquire()
+
+    def _on_failure(self, exc: BaseException) -> bool:
+        """Records a failed attempt; returns whether it may be retried."""
+        retryable = is_retryable(exc)
+        if retryable:
+            # only provider-side trouble counts towards opening the circuit
+            self.breaker.record_failure()
+            if is_rate_limit_error(exc):
+                self.bucket.penalize()
+        else:
+            self.breaker.release_probe()
+        return retryable
+
+    def _on_success(self):
+        self.breaker.record_success()
+        self.bucket.reward()
+
+    async def _hedged(self, start: Callable[[], Awaitable[Any]], discard: Optional[Callable[[Any], Awaitable[None]]]) -> Any:
+        """
+        Awaits start(); if it is slower than hedge_after, races a second start()
+        against it. A result that loses the race, or that arrives after the
+        caller was cancelled, is passed to discard().
+        """
+        racers = {asyncio.ensure_future(start())}
+        winner = None
+        try:
+            if self.hedge_after > 0:
+                done, _ = await asyncio.wait(racers, timeout=self.hedge_after)
+                if not done:
+                    self.stats_counts["hedged"] += 1
+                    racers.add(asyncio.ensure_future(start()))
+            while True:
+                done, pending = await asyncio.wait(racers, return_when=asyncio.FIRST_COMPLETED)
+                winners = [task for task in done if task.exception() is None]
+                if winners:
+                    winner = winners[0]
+                    return winner.result()
+                if not pending:
+                    raise next(iter(done)).exception()
+                racers = pending
+        finally:
+            # asyncio.wait() doesn't cancel its tasks when we are cancelled
+            for task in racers:
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                elif discard is not None and not task.cancelled() and task.exception() is None:
+                    await discard(task.result())
+
+    async def call(self, fn: Callable[[], Awaitable[Any]],
+                   discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+                   timeout: Optional[float] = None) -> Any:
+        """Runs fn() (a fresh awaitable per attempt) under the policy; `timeout` overrides self.timeout."""
+        timeout = self.timeout if timeout is None else timeout
+        self.stats_counts["calls"] += 1
+        attempt = 0
+        while True:
+            await self._admit()
+            try:
+                if timeout > 0:
+                    result = await asyncio.wait_for(self._hedged(fn, discard), timeout)
+                else:
+                    result = await self._hedged(fn, discard)
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not self._on_failure(e) or attempt >= self.max_retries:
+                    self.stats_counts["failures"] += 1
+                    raise
+                attempt += 1
+                self.stats_counts["retries"] += 1
+                await asyncio.sleep(self.backoff(attempt))
+                continue
+            self._on_success()
+            return result
+
+    async def stream(self, factory: Callable[[], AsyncIterator[Any]]) -> AsyncGenerator[Any, None]:
+        """
+        Streams from factory() under the policy. Retries and hedging only apply
+        until the first chunk arrives: once output has been forwarded, a failure
+        is raised to the caller rather than replaying a partial answer.
+        """
+        async def first_chunk() -> Tuple[AsyncIterator[Any], Any]:
+            iterator = factory().__aiter__()
+            try:
+                return iterator, await iterator.__anext__()
+            except BaseException:
+                await _aclose(iterator)
+                raise
+
+        async def opener() -> Tuple[AsyncIterator[Any], Any]:
+            try:
+                return await first_chunk()
+            except StopAsyncIteration:
+                return None, None
+
+        async def discard(opened: Tuple[Optional[AsyncIterator[Any]], Any]):
+            if opened[0] is not None:
+                await _aclose(opened[0])
+
+        iterator, chunk = await self.call(opener, discard, timeout=self.first_chunk_timeout)
+        if iterator is None:
+            return
+        try:
+            yield chunk
+            async for chunk in iterator:
+                yield chunk
+        except Exception as e:
+            if is_retryable(e):
+                self.breaker.record_failure()
+            raise
+        finally:
+            await _aclose(iterator)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.stats_counts, state=self.breaker.state, rate=round(self.bucket.rate, 3))
+
+async def _aclose(iterator: Any):
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        try:
+            await aclose()
+        except Exception:
+            pass
+
+def policy_from_env(prefix: str, name: str, **defaults) -> ResiliencePolicy:
+    def setting(key: str, default: float) -> float:
+        return float(os.getenv(f"{prefix}_{key}", str(defaults.get(key.lower(), default))))
+    return ResiliencePolicy(
+        name,
+        rate=setting("RATE_PER_SECOND", 0),
+        burst=setting("RATE_BURST", 10),
+        max_retries=int(setting("MAX_RETRIES", 2)),
+        retry_base=setting("RETRY_BASE_SECONDS", 0.5),
+        retry_max=setting("RETRY_MAX_SECONDS", 8),
+        failure_threshold=int(setting("CIRCUIT_FAILURES", 5)),
+        reset_timeout=setting("CIRCUIT_RESET_SECONDS", 30),
+        hedge_after=setting("HEDGE_AFTER_SECONDS", 0),
+        # deadlines come from the caller, which owns their settings
+        # (LLM_TIMEOUT_SECONDS in model_registry.py)
+        timeout=float(defaults.get("timeout", 0)),
+        first_chunk_timeout=float(defaults.get("first_chunk_timeout", 0)),
+    )
+
+# (prefix, key digest) -> policy; keys are hashed so they never sit in memory dumps or stats
+_POLICIES: Dict[Tuple[str, str], ResiliencePolicy] = {}
+
+def get_policy(prefix: str, api_key: Optional[str] = None, **defaults) -> ResiliencePolicy:
+    """The shared policy for a provider (LLM, SEARCH) and API key, created from the environment on first use."""
+    digest = hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+    key = (prefix, digest)
+    policy = _POLICIES.get(key)
+    if policy is None:
+        policy = _POLICIES[key] = policy_from_env(prefix, f"{prefix.lower()}:{digest[:6]}", **defaults)
+    return policy
+
+def resilience_stats() -> Dict[str, Any]:
+    return {policy.name: policy.stats() for policy in _POLICIES.values()}
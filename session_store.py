@@ -0,0 +1,72 @@
+# session_store.py
+import os
+import copy
+from typing import Any, Dict, Optional
+
+from ttl_cache import MISSING, SQLiteCache, TTLCache
+
+class SessionStore:
+    """
+    Conversation sessions keyed by conversation_id.
+
+    Every session expires `ttl` seconds after it was last written, the store
+    keeps at most `max_sessions` (least recently used are evicted first) and a
+    session's "history" list is capped at `max_history` entries.
+    get() returns a copy; persist changes with save().
+    """
+
+    def __init__(self, backend: Any, max_history: int = 20):
+        self.backend = backend
+        self.max_history = max(1, int(max_history))
+
+    def get(self, conversation_id: str, default: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        data = self.backend.get(conversation_id)
+        if data is MISSING:
+            return default
+        return copy.deepcopy(data)
+
+    def save(self, conversation_id: str, data: Dict[str, Any]):
+        history = data.get("history")
+        if isinstance(history, list) and len(history) > self.max_history:
+            data = dict(data, history=history[-self.max_history:])
+        self.backend.set(conversation_id, data)
+
+    # a new session is just the first save
+    create = save
+
+    def delete(self, conversation_id: str):
+        self.backend.delete(conversation_id)
+
+    def __contains__(self, conversation_id: str) -> bool:
+        return self.backend.get(conversation_id) is not MISSING
+
+    def __len__(self) -> int:
+        return len(self.backend)
+
+def create_session_store() -> SessionStore:
+    """
+    Builds the store from the environment.
+    SESSION_BACKEND=memory (default) keeps sessions in this process only;
+    SESSION_BACKEND=sqlite stores them in SESSION_DB_PATH so every uvicorn
+    worker on the host can serve the same conversation_id.
+    Store calls run on the event loop, so SESSION_DB_BUSY_TIMEOUT_SECONDS
+    (default 0.25) bounds how long one waits on another worker's write lock.
+    """
+    backend_name = os.getenv("SESSION_BACKEND", "memory").lower()
+    ttl = float(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600)))
+    max_sessions = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+    max_history = int(os.getenv("SESSION_MAX_HISTORY", "20"))
+
+    if backend_name == "sqlite":
+        backend = SQLiteCache(
+            os.getenv("SESSION_DB_PATH", "sessions.db"),
+            max_entries=max_sessions,
+            ttl=ttl,
+            table="sessions",
+            busy_timeout=float(os.getenv("SESSION_DB_BUSY_TIMEOUT_SECONDS", "0.25")),
+        )
+    elif backend_name == "memory":
+        backend = TTLCache(max_entries=max_sessions, ttl=ttl)
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend_name}")
+    return SessionStore(backend, max_history=max_history)
@@ -0,0 +1,100 @@
+# sse.py
+import os
+import json
+import asyncio
+from typing import Any, AsyncGenerator, AsyncIterable, Callable, Iterable, List, Optional
+
+# Small chunks (single tokens, marker lines) are merged into one SSE frame per
+# window: a frame is flushed once SSE_COALESCE_MS have passed since its first
+# chunk arrived or once it holds SSE_COALESCE_BYTES characters. 0 ms disables it.
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "25"))
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "2048"))
+
+def format_sse(data: str, event_id: Optional[int] = None, event: Optional[str] = None) -> str:
+    """
+    Frames one SSE event. Every line of a multi-line payload gets its own
+    "data:" field, so clients reassemble the exact text (including newlines)
+    instead of seeing the frame cut short at the first blank line.
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    for line in data.split("\n"):
+        lines.append(f"data: {line}")
+    return "\n".join(lines) + "\n\n"
+
+def encode_event(event: dict) -> str:
+    """One structured event as a compact JSON line."""
+    return json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+def merge_deltas(events: Iterable[dict]) -> List[dict]:
+    """Merges runs of delta events for the same part and section into one event."""
+    merged = []
+    for event in events:
+        last = merged[-1] if merged else None
+        if (last is not None and event.get("type") == "delta" and last.get("type") == "delta"
+                and last.get("part") == event.get("part") and last.get("section") == event.get("section")):
+            merged[-1] = dict(last, text=last["text"] + event["text"], t=event.get("t", last.get("t")))
+        else:
+            merged.append(event)
+    return merged
+
+def encode_events(events: Iterable[dict]) -> str:
+    """NDJSON body for a batch of structured events, with adjacent deltas merged."""
+    return "".join(encode_event(event) for event in merge_deltas(events))
+
+def event_size(event: dict) -> int:
+    """Rough encoded size of an event, for size-based coalescing without encoding it twice."""
+    return len(event.get("text", "")) + 48
+
+async def coalesce(source: AsyncIterable[Any], max_delay: Optional[float] = None,
+                   max_bytes: Optional[int] = None, join: Callable[[list], Any] = "".join,
+                   measure: Callable[[Any], int] = len) -> AsyncGenerator[Any, None]:
+    """
+    Merges consecutive chunks from `source` by time and size window. Chunks are
+    strings by default; pass join/measure to batch other items (e.g. structured
+    events with join=encode_events, measure=event_size).
+    """
+    max_delay = SSE_COALESCE_MS / 1000.0 if max_delay is None else max_delay
+    max_bytes = SSE_COALESCE_BYTES if max_bytes is None else max_bytes
+    if max_delay <= 0:
+        async for chunk in source:
+            yield join([chunk])
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = source.__aiter__()
+    pending = []
+    size = 0
+    deadline = 0.0
+    next_chunk = None
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, deadline - loop.time()) if pending else None
+            done, _ = await asyncio.wait({next_chunk}, timeout=timeout)
+            if not done:
+                # window expired while the source is still working: flush what we have
+                yield join(pending)
+                pending, size = [], 0
+                continue
+            task, next_chunk = next_chunk, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                break
+            if not pending:
+                deadline = loop.time() + max_delay
+            pending.append(chunk)
+            size += measure(chunk)
+            if size >= max_bytes:
+                yield join(pending)
+                pending, size = [], 0
+        if pending:
+            yield join(pending)
+    finally:
+        if next_chunk is not None:
+            next_chunk.cancel()
@@ -0,0 +1,40 @@
+# stream_buffer.py
+import asyncio
+from typing import Any, AsyncGenerator, Optional, Tuple
+
+class StreamBuffer:
+    """
+    Append-only event log that any number of readers can follow while it is
+    still being written. A reader that joins late first gets everything
+    already buffered, then waits for new events until the buffer is closed.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def append(self, event: Any):
+        self.events.append(event)
+        self._notify()
+
+    def close(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def subscribe(self, start: int = 0) -> AsyncGenerator[Tuple[int, Any], None]:
+        """Yields (index, event) pairs from `start` onwards until the buffer is closed."""
+        index = max(0, start)
+        while True:
+            while index < len(self.events):
+                yield index, self.events[index]
+                index += 1
+            if self.done:
+                return
+            await self._changed.wait()
@@ -0,0 +1,216 @@
+# ttl_cache.py
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Returned by get() on a miss so that None can still be cached as a value
+MISSING = object()
+
+# TieredCache is read and written from the event loop; its disk tier gives up on
+# another process's write lock after this long (the call then counts as a miss
+# or a skipped write) instead of stalling every open stream
+CACHE_DB_BUSY_TIMEOUT_SECONDS = float(os.getenv("CACHE_DB_BUSY_TIMEOUT_SECONDS", "0.25"))
+
+class TTLCache:
+    """In-memory LRU cache with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+class SQLiteCache:
+    """
+    On-disk cache tier backed by a single SQLite table.
+    Values must be JSON-serializable. Expired rows are skipped on read and
+    purged, together with the least recently used overflow, as soon as a
+    write takes the table past `max_entries`.
+    `busy_timeout` is how long a call waits on another process's write lock
+    before raising sqlite3.OperationalError; keep it short when the cache is
+    used from the event loop.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: Optional[float] = 86400.0, table: str = "cache",
+                 busy_timeout: float = 5.0):
+        self.path = path
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] <= now):
+                self.misses += 1
+                return MISSING
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        payload = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now),
+            )
+            # the real row count, since other processes may share the file;
+            # cheap at cache sizes
+            if self._count() > self.max_entries:
+                self._prune(now)
+            self._conn.commit()
+
+    def _count(self) -> int:
+        return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def _prune(self, now: float):
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        self._conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f"SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
+
+class TieredCache:
+    """
+    Memory LRU in front of an optional SQLite tier. Disk hits are promoted to
+    memory; writes go to both tiers.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 3600.0,
+                 disk_path: Optional[str] = None, disk_max_entries: int = 100000, table: str = "cache",
+                 disk_busy_timeout: float = CACHE_DB_BUSY_TIMEOUT_SECONDS):
+        self.memory = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.disk = SQLiteCache(disk_path, max_entries=disk_max_entries, ttl=ttl, table=table,
+                                busy_timeout=disk_busy_timeout) if disk_path else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Any:
+        value = self.memory.get(key)
+        if value is MISSING and self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except Exception:
+                value = MISSING
+            if value is not MISSING:
+                self.memory.set(key, value)
+        if value is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self.memory.set(key, value, ttl)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value, ttl)
+            except Exception:
+                # the disk tier is best-effort (e.g. value not JSON-serializable, or file locked)
+                pass
+
+    def delete(self, key: str):
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }